@@ -1,32 +1,134 @@
-import gradio as gr
-import requests
-from tkinter import filedialog, messagebox
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
-from googleapiclient.http import MediaFileUpload
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-
-
 import os
+import json
+import datetime
+import random
+import hashlib
+import sqlite3
 import pickle
 import re
 import sys
 import webbrowser
-from tkinter import Tk
 import time
 import shutil
+import threading
+import queue
+import importlib
+import importlib.util
+import argparse
+import contextlib
+import functools
+import fnmatch
+import heapq
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from googleapiclient.errors import HttpError  # Module nhẹ, cần có sẵn cho các khối except
+
+
+class _LazyModule:
+    """Đại diện cho một module, chỉ import module thật ở lần truy cập thuộc tính đầu tiên."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Các thư viện nặng (gradio, tkinter, Google API client, OAuth, requests...) được import lúc dùng lần đầu,
+# nên app (và các tiến trình con của ProcessPoolExecutor) khởi động ngay
+gr = _LazyModule("gradio")
+asyncio = _LazyModule("asyncio")  # Chỉ engine asyncio dùng tới
+requests = _LazyModule("requests")
+tkinter = _LazyModule("tkinter")
+filedialog = _LazyModule("tkinter.filedialog")
+messagebox = _LazyModule("tkinter.messagebox")
+discovery = _LazyModule("googleapiclient.discovery")
+gapi_http = _LazyModule("googleapiclient.http")
+oauth_flow = _LazyModule("google_auth_oauthlib.flow")
+auth_requests = _LazyModule("google.auth.transport.requests")
+auth_exceptions = _LazyModule("google.auth.exceptions")
+aiohttp = _LazyModule("aiohttp")  # Tùy chọn: engine asyncio cho rất nhiều file nhỏ
+HAS_AIOHTTP = importlib.util.find_spec("aiohttp") is not None
 
 
 
 # Function to browse for download directory
 download_folder_path = ""  # Global variable to store the path
 status_messages = []
-exclude_str = ""
 drive_service = None
+DEFAULT_DOWNLOAD_WORKERS = 8  # Số luồng tải song song mặc định
+DEFAULT_UPLOAD_WORKERS = 8  # Số luồng tải lên song song mặc định
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+GOOGLE_APPS_MIME_PREFIX = 'application/vnd.google-apps.'  # Docs, Sheets, Slides...: không có nội dung nhị phân để tải
+WALK_QUEUE_SIZE = 1000  # Số file tối đa chờ trong hàng đợi giữa bước liệt kê và bước tải
+LIST_PAGE_SIZE = 1000  # pageSize tối đa mà files().list cho phép
+LIST_PARENTS_PER_QUERY = 50  # Số thư mục cùng cấp được gộp vào một truy vấn `in parents`
+FILE_FIELDS = 'id, name, mimeType, size, md5Checksum, modifiedTime, parents, shortcutDetails'
+LIST_FIELDS = f'nextPageToken, files({FILE_FIELDS})'
+CHANGE_FIELDS = f'nextPageToken, newStartPageToken, changes(changeType, fileId, removed, file({FILE_FIELDS}, trashed))'
+INDEX_FILE_NAME = ".gdrive_index.sqlite"  # Chỉ mục các file đã tải, nằm trong thư mục tải về
+HASH_CACHE_FILE = "upload_hash_cache.sqlite"  # MD5 của file trên máy đã băm khi đồng bộ tải lên
+LISTING_CACHE_FILE = "listing_cache.sqlite"  # Danh sách mục con của các thư mục Drive đã liệt kê
+# Dùng lại danh sách thư mục đã liệt kê trong bấy nhiêu phút, 0 là tắt. Mặc định tắt: Drive không phải lúc nào
+# cũng đổi modifiedTime của thư mục khi có file mới, nên chạy lại có thể bỏ sót file nếu dùng cache
+DEFAULT_LISTING_TTL_MIN = 0
+LISTING_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Vượt quá thì xóa các mục lâu không dùng nhất (LRU)
+JOBS_JOURNAL_FILE = "jobs_journal.jsonl"  # Nhật ký chỉ ghi thêm của hàng đợi job, để chạy tiếp sau khi tắt đột ngột
+DEFAULT_CONCURRENT_JOBS = 1  # Số job tải chạy cùng lúc
+JOB_HISTORY_LIMIT = 50  # Số job đã kết thúc còn giữ trong nhật ký khi khởi động lại
+JOB_POLL_INTERVAL = 2  # Giao diện cập nhật bảng job sau mỗi bấy nhiêu giây
+JOB_PRIORITIES = {0: "Cao", 1: "Bình thường", 2: "Thấp"}  # Số nhỏ chạy trước
+JOB_QUEUED, JOB_RUNNING, JOB_PAUSED, JOB_CANCELLED, JOB_DONE, JOB_FAILED = (
+    "queued", "running", "paused", "cancelled", "done", "failed")
+JOB_STATUS_LABELS = {JOB_QUEUED: "Đang chờ", JOB_RUNNING: "Đang chạy", JOB_PAUSED: "Tạm dừng",
+                     JOB_CANCELLED: "Đã hủy", JOB_DONE: "Xong", JOB_FAILED: "Lỗi"}
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+# Vai trò -> (tệp token, tệp client OAuth)
+CREDENTIAL_ROLES = {
+    'download': ('download_token.pickle', 'ggdownload.json'),
+    'upload': ('upload_token.pickle', 'ggupload.json'),
+}
+TOKEN_REFRESH_MARGIN = 300  # Làm mới token khi còn ít hơn bấy nhiêu giây là hết hạn
+TOKEN_CHECK_INTERVAL = 60  # Chu kỳ (giây) luồng nền kiểm tra hạn token
+SMALL_UPLOAD_LIMIT = 5 * 1024 * 1024  # File nhỏ hơn mức này được tải lên bằng một request multipart
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # Chunk của phiên tải lên resumable, phải là bội số của 256 KB
+UPLOAD_SESSIONS_FILE = "upload_sessions.json"  # Phiên tải lên resumable đang dở, để chạy lại thì tải tiếp
+# Thứ tự tải khi lập kế hoạch trước
+PLAN_ORDER_LISTING = "listing"  # Theo thứ tự liệt kê
+PLAN_ORDER_SMALLEST = "smallest"  # File nhỏ trước: có kết quả từng phần sớm
+PLAN_ORDER_LARGEST = "largest"  # File lớn trước: tận dụng tối đa băng thông
+DEFAULT_SEGMENT_COUNT = 8  # Số đoạn tải song song cho một file lớn
+DEFAULT_SEGMENT_THRESHOLD_MB = 256  # File từ kích thước này trở lên được tải theo đoạn
+DRIVE_MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+DOWNLOAD_TIMEOUT = (10, 60)  # (kết nối, đọc) tính theo giây
+STREAM_CHUNK_SIZE = 1024 * 1024
+PART_SUFFIX = ".part"  # File đang tải dở, chỉ đổi tên thành file thật khi đã tải xong
+STATE_SUFFIX = ".json"  # Tệp trạng thái đi kèm file `.part`
+STATE_SAVE_INTERVAL = 8 * 1024 * 1024  # Cập nhật tệp trạng thái sau mỗi lượng byte này
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024  # Mỗi lần ghi đĩa là một khối tuần tự cỡ này
+WRITE_BUFFER_COUNT = 16  # Số buffer dùng chung cho mọi luồng tải: RAM tối đa = 16 x 4 MB
+DOWNLOAD_ATTEMPTS = 3  # Số lần tải một file khi MD5 không khớp
+RETRY_ATTEMPTS = 8  # Số lần gọi lại một yêu cầu Drive API bị lỗi tạm thời (quota, 5xx)
+# Bộ điều phối yêu cầu: tốc độ gọi API (yêu cầu/giây) tự điều chỉnh để nằm ngay dưới quota
+INITIAL_REQUEST_RATE = 20.0
+MIN_REQUEST_RATE = 1.0
+MAX_REQUEST_RATE = 200.0  # Quota mặc định của Drive API là 12.000 yêu cầu/phút cho mỗi người dùng
+RATE_INCREASE = 1.0  # Tăng thêm khoảng này (yêu cầu/giây) sau mỗi giây chạy êm
+RATE_DECREASE = 0.5  # Nhân tốc độ với hệ số này khi bị giới hạn quota
+# Engine asyncio (cần aiohttp): một luồng, nhiều kết nối keep-alive dùng chung
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+ASYNC_CONCURRENCY = 256  # Số yêu cầu HTTP đồng thời tối đa của engine asyncio
+ASYNC_FILE_LIMIT = 8 * 1024 * 1024  # Chỉ file nhỏ hơn mức này mới đi qua engine asyncio
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RETRYABLE_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
+BATCH_LIMIT = 100  # Số yêu cầu tối đa Drive API cho phép trong một batch HTTP
+ROOT_FIELDS = FILE_FIELDS + ', driveId'
+LINK_CHECK_TIMEOUT = (5, 10)  # (kết nối, đọc) khi mở trang Drive để kiểm tra link
+LINK_CHECK_WORKERS = 16  # Số link được mở trang kiểm tra song song
 
 def initialize_uploader():
     global drive_service
@@ -78,6 +180,7 @@ def check_json_files():
 def delete_api_keys():
     
     files_to_delete = ["upload_token.pickle", "download_token.pickle"]
+    credential_cache.clear()
     deleted_files = []
     for file_name in files_to_delete:
         if os.path.exists(file_name):
@@ -91,26 +194,34 @@ def delete_api_keys():
         gr.Info("Không tìm thấy các tệp API Key để xóa.", visible=True, duration=2)
         return "Không tìm thấy các tệp API Key để xóa."
     
-def validate_folder_link(drive_service, folder_link):
-    if not isinstance(folder_link, str) or not folder_link.strip():
-        return False, "Liên kết thư mục không hợp lệ hoặc để trống. Vui lòng nhập lại liên kết."
-
-    folder_id = extract_folder_id_from_url(folder_link)
-    if folder_id is None:
-        return False, "Liên kết không hợp lệ. Vui lòng kiểm tra lại."
+def validate_folder_links(drive_service, folder_links):
+    """Kiểm tra nhiều link thư mục cùng lúc: metadata của tất cả được lấy bằng batch."""
+    folder_ids = [extract_drive_id(link) if isinstance(link, str) and link.strip() else None
+                  for link in folder_links]
+    # Kiểm tra thư mục bằng cách lấy metadata của nó
+    metadata = fetch_drive_metadata(drive_service, [folder_id for folder_id in folder_ids if folder_id],
+                                    fields="id, name")
+
+    results = []
+    for folder_link, folder_id in zip(folder_links, folder_ids):
+        if not isinstance(folder_link, str) or not folder_link.strip():
+            results.append((False, "Liên kết thư mục không hợp lệ hoặc để trống. Vui lòng nhập lại liên kết."))
+            continue
+        if folder_id is None:
+            results.append((False, "Liên kết không hợp lệ. Vui lòng kiểm tra lại."))
+            continue
 
-    try:
-        # Kiểm tra thư mục bằng cách lấy metadata của nó
-        folder = drive_service.files().get(fileId=folder_id, fields="id, name", supportsAllDrives=True).execute()
-        return True, f"Thư mục đích '{folder.get('name')}' đã được xác minh."
-    except HttpError as e:
+        folder, e = metadata[folder_id]
+        if e is None:
+            results.append((True, f"Thư mục đích '{folder.get('name')}' đã được xác minh."))
         # Xử lý nếu thư mục không tồn tại hoặc không có quyền truy cập
-        if e.resp.status == 404:
-            return False, "Thư mục không tồn tại. Vui lòng kiểm tra lại liên kết."
-        elif e.resp.status == 403:
-            return False, "Bạn không có quyền truy cập vào thư mục này. Vui lòng yêu cầu quyền truy cập."
+        elif isinstance(e, HttpError) and e.resp.status == 404:
+            results.append((False, "Thư mục không tồn tại. Vui lòng kiểm tra lại liên kết."))
+        elif isinstance(e, HttpError) and e.resp.status == 403:
+            results.append((False, "Bạn không có quyền truy cập vào thư mục này. Vui lòng yêu cầu quyền truy cập."))
         else:
-            return False, f"Lỗi không xác định: {e}"
+            results.append((False, f"Lỗi không xác định: {e}"))
+    return results
 
 
 
@@ -129,7 +240,7 @@ def validate_inputs(shared_drive_links, folder_path):
 
 def browse_files():
     #global selected_file_path
-    root = Tk()
+    root = tkinter.Tk()
     root.attributes("-topmost", True)
     root.withdraw()  
     selected_file_paths = filedialog.askopenfilenames()  
@@ -145,7 +256,7 @@ def browse_files():
 
 def browse_directory():
     global download_folder_path
-    root = Tk()
+    root = tkinter.Tk()
     root.attributes("-topmost", True)
     root.withdraw()  
     download_folder_path = filedialog.askdirectory()  
@@ -164,30 +275,81 @@ def open_output_folder():
         messagebox.showerror("Lỗi", "Chưa chọn thư mục tải về. Vui lòng chọn lại !!!")
 
 # Function to validate and check Google Drive URLs
+DRIVE_URL_PATTERN = r"(https?://drive\.google\.com/.*)"
+_link_session = None
+_link_session_lock = threading.Lock()
+
+
+def get_link_session():
+    """Một `requests.Session` dùng chung để kiểm tra link, giữ sẵn kết nối cho các luồng kiểm tra."""
+    global _link_session
+    with _link_session_lock:
+        if _link_session is None:
+            _link_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=LINK_CHECK_WORKERS)
+            _link_session.mount("https://", adapter)
+        return _link_session
+
+
 def validate_url(url):
-    drive_url_pattern = r"(https?://drive\.google\.com/.*)"
     print(f"Check URL : {url} !")
 
     # Kiểm tra URL có đúng định dạng Google Drive không
-    if not re.match(drive_url_pattern, url):
+    if not re.match(DRIVE_URL_PATTERN, url):
         
         return False, f"link {url} ---> không phải Google Drive, vui lòng kiểm tra lại!"
     
-    # Kiểm tra URL có bị khóa (private) hoặc lỗi 404 không
+    # Kiểm tra URL có bị khóa (private) hoặc lỗi 404 không; chỉ cần URL sau chuyển hướng, không tải nội dung trang
     try:
-        response = requests.get(url)
-        if 'ServiceLogin' in response.url:
-            
-            return False, f"link {url} ---> đã bị khóa, vui lòng liên hệ người chia sẻ để cấp quyền truy cập cho bạn!"
-        elif response.status_code == 404:
-            
-            return False, f"link {url} ---> sai định dạng của Google Drive, vui lòng kiểm tra lại!"
+        with get_link_session().get(url, timeout=LINK_CHECK_TIMEOUT, stream=True) as response:
+            if 'ServiceLogin' in response.url:
+                
+                return False, f"link {url} ---> đã bị khóa, vui lòng liên hệ người chia sẻ để cấp quyền truy cập cho bạn!"
+            elif response.status_code == 404:
+                
+                return False, f"link {url} ---> sai định dạng của Google Drive, vui lòng kiểm tra lại!"
     except requests.RequestException as e:
         return False, f"Không thể kiểm tra URL {url}, lỗi: {str(e)}"
     
     return True, " ---> đã tải thành công !!!"
 
 
+def validate_links(drive_service, links):
+    """Kiểm tra nhiều link tải về cùng lúc.
+
+    Metadata của mọi link được lấy bằng batch, mỗi ID một yêu cầu con; chỉ những link lỗi mới được
+    mở trang Drive (song song, có timeout) để biết lý do. Trả về (các link hợp lệ, thông báo lỗi,
+    dict ID -> (metadata, lỗi)) để bước tải dùng lại metadata mà không phải gọi API lần nữa.
+    """
+    link_ids = {}
+    for link in links:
+        if re.match(DRIVE_URL_PATTERN, link):
+            link_ids[link] = extract_drive_id(link)
+    metadata = fetch_drive_metadata(drive_service, [file_id for file_id in link_ids.values() if file_id])
+
+    failed = [link for link, file_id in link_ids.items() if file_id is None or metadata[file_id][1] is not None]
+    with ThreadPoolExecutor(max_workers=LINK_CHECK_WORKERS) as pool:
+        reasons = dict(zip(failed, pool.map(validate_url, failed)))
+
+    valid_links, messages = [], []
+    for link in links:
+        if link not in link_ids:
+            messages.append(f"link {link} ---> không phải Google Drive, vui lòng kiểm tra lại!")
+        elif link not in reasons:
+            valid_links.append(link)
+        else:
+            page_ok, message = reasons[link]
+            if page_ok and link_ids[link] is None:
+                message = f"link {link} ---> không tìm thấy ID file/thư mục trong link, vui lòng kiểm tra lại!"
+            elif page_ok:
+                # Trang mở được nhưng tài khoản đang dùng không đọc được file qua API
+                message = (f"link {link} ---> tài khoản Google Drive của bạn không truy cập được: "
+                           f"{metadata[link_ids[link]][1]}")
+            messages.append(message)
+    roots = {link_ids[link]: metadata[link_ids[link]] for link in valid_links}
+    return valid_links, messages, roots
+
+
 
 
 def load_client_info(json_path='credentials.json'):
@@ -198,10 +360,1530 @@ def load_client_info(json_path='credentials.json'):
         client_secret = data["installed"]["client_secret"]
     return client_id, client_secret
 
+
+def hash_file(path, limit=None, md5=None, offset=0):
+    """Băm MD5 nội dung file (hoặc `limit` byte) từ `offset`, trả về đối tượng hashlib để băm tiếp.
+
+    Truyền `md5` để băm tiếp vào một đối tượng đã băm phần trước đó của file.
+    """
+    md5 = md5 if md5 is not None else hashlib.md5()
+    remaining = limit
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while remaining is None or remaining > 0:
+            chunk = f.read(STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            md5.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return md5
+
+
+def file_md5(path):
+    """MD5 dạng hex của file; là hàm cấp module để chạy được trong ProcessPoolExecutor."""
+    return hash_file(path).hexdigest()
+
+
+def _error_status(error):
+    """Mã HTTP của lỗi từ Drive client (HttpError) hoặc từ requests (HTTPError), None nếu không có."""
+    if isinstance(error, HttpError):
+        return error.resp.status
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def _error_reasons(error):
+    """Chuỗi chứa lý do lỗi (`reason`) mà Drive trả về.
+
+    HttpError đã kèm nội dung phản hồi trong str(); với requests.HTTPError thì str() chỉ có
+    "403 Client Error: Forbidden for url: ...", lý do nằm trong body JSON của phản hồi.
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        try:
+            errors = error.response.json()['error'].get('errors', [])
+            return " ".join(str(item.get('reason', '')) for item in errors)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return error.response.text or ""
+    return str(error)
+
+
+def is_quota_error(error):
+    """Lỗi do gọi API quá nhanh (429 hoặc 403 rateLimitExceeded)."""
+    status = _error_status(error)
+    return status == 429 or (status == 403 and any(reason in _error_reasons(error) for reason in RETRYABLE_REASONS))
+
+
+def is_retryable_error(error):
+    """Lỗi tạm thời của Drive API (hết quota, lỗi máy chủ) nên gọi lại sau một lúc."""
+    return _error_status(error) in RETRYABLE_STATUSES or is_quota_error(error)
+
+
+class RequestScheduler:
+    """Điều phối chung cho mọi yêu cầu Drive API của cả chương trình.
+
+    Mỗi yêu cầu phải lấy một token từ token bucket trước khi gửi. Tốc độ nạp token tăng dần
+    khi mọi thứ êm và giảm một nửa khi Drive báo vượt quota (AIMD), nên số yêu cầu luôn ở ngay
+    dưới giới hạn. Lỗi tạm thời được gọi lại với thời gian chờ tăng dần có jitter.
+    """
+    def __init__(self, rate=INITIAL_REQUEST_RATE, min_rate=MIN_REQUEST_RATE, max_rate=MAX_REQUEST_RATE):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _take(self, cost):
+        """Trừ `cost` token nếu bucket còn token (được phép âm để batch lớn không bị chặn mãi).
+
+        Trả về 0 nếu đã lấy được, ngược lại là số giây cần chờ trước khi thử lại.
+        """
+        with self._lock:
+            now = time.monotonic()
+            # Bucket chứa tối đa lượng token của một giây
+            self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= cost
+                self.requests += cost
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, cost=1):
+        """Chờ tới khi lấy được token."""
+        while True:
+            delay = self._take(cost)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self, cost=1):
+        """Như `acquire` nhưng dùng trong engine asyncio, không chặn event loop."""
+        while True:
+            delay = self._take(cost)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self._max_rate, self.rate + RATE_INCREASE / self.rate)
+
+    def on_throttled(self):
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            # Nhiều luồng cùng bị 429 một lúc chỉ tính là một lần giảm tốc
+            if now - self._last_decrease >= 1:
+                self.rate = max(self._min_rate, self.rate * RATE_DECREASE)
+                self._last_decrease = now
+
+    def retry_delay(self, attempt, quota=False):
+        """Ghi nhận một lần thử lại, trả về thời gian chờ theo hàm mũ có jitter."""
+        with self._lock:
+            self.retries += 1
+        if quota:
+            self.on_throttled()
+        return min(2 ** attempt, 32) + random.random()
+
+    def backoff(self, attempt, error=None):
+        time.sleep(self.retry_delay(attempt, error is not None and is_quota_error(error)))
+
+    def call(self, func, *args, cost=1, attempts=RETRY_ATTEMPTS, **kwargs):
+        """Gọi `func` qua bucket, thử lại khi gặp lỗi tạm thời."""
+        for attempt in range(attempts):
+            self.acquire(cost)
+            try:
+                result = func(*args, **kwargs)
+            except (HttpError, requests.HTTPError) as e:
+                if attempt == attempts - 1 or not is_retryable_error(e):
+                    raise
+                self.backoff(attempt, e)
+                continue
+            self.on_success()
+            return result
+
+    def execute(self, request, attempts=RETRY_ATTEMPTS):
+        return self.call(request.execute, attempts=attempts)
+
+    def next_chunk(self, request):
+        """`next_chunk()` của MediaIoBaseDownload hoặc request tải lên resumable, có thử lại."""
+        return self.call(request.next_chunk)
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'requests': self.requests, 'retries': self.retries,
+                    'throttled': self.throttled}
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Drive API: {stats['requests']} yêu cầu, tốc độ hiện tại {stats['rate']:0.1f} yêu cầu/giây, "
+                f"{stats['retries']} lần thử lại ({stats['throttled']} lần bị giới hạn quota).")
+
+
+# Dùng chung cho mọi luồng và mọi lần tải để tốc độ đã học được không bị mất giữa các lần bấm nút
+drive_scheduler = RequestScheduler()
+
+
+class DriveBatch:
+    """Gom nhiều yêu cầu metadata nhỏ (get, create thư mục...) vào ít lượt HTTP nhất có thể,
+    dựa trên `new_batch_http_request` của Drive client (tối đa BATCH_LIMIT yêu cầu mỗi lượt)."""
+    def __init__(self, service):
+        self._service = service
+
+    def execute(self, requests_list, attempts=RETRY_ATTEMPTS):
+        """Chạy các request, trả về danh sách (kết quả, lỗi) theo đúng thứ tự đầu vào.
+
+        Request bị lỗi tạm thời (quota, 5xx) được gửi lại trong batch sau.
+        """
+        results = [(None, None)] * len(requests_list)
+        pending = list(range(len(requests_list)))
+        for attempt in range(attempts):
+            for start in range(0, len(pending), BATCH_LIMIT):
+                batch = self._service.new_batch_http_request()
+                chunk = pending[start:start + BATCH_LIMIT]
+                for index in chunk:
+                    batch.add(requests_list[index], callback=self._store(results, index), request_id=str(index))
+                # Mỗi yêu cầu trong batch vẫn được Drive tính riêng vào quota
+                drive_scheduler.call(batch.execute, cost=len(chunk))
+            pending = [index for index in pending
+                       if isinstance(results[index][1], HttpError) and is_retryable_error(results[index][1])]
+            if not pending or attempt == attempts - 1:
+                break
+            errors = [results[index][1] for index in pending]
+            drive_scheduler.backoff(attempt, next((e for e in errors if is_quota_error(e)), errors[0]))
+        return results
+
+    @staticmethod
+    def _store(results, index):
+        def callback(request_id, response, exception):
+            results[index] = (response, exception)
+        return callback
+
+
+def extract_drive_id(url):
+    """Lấy ID file/thư mục từ link Google Drive, trả về None nếu không tìm thấy."""
+    match = re.search(r'[-\w]{25,}', url)
+    return match.group(0) if match else None
+
+
+def fetch_drive_metadata(service, file_ids, fields=ROOT_FIELDS):
+    """Lấy metadata của nhiều file/thư mục bằng batch; trả về dict ID -> (metadata, lỗi)."""
+    unique_ids = list(dict.fromkeys(file_ids))
+    requests_list = [service.files().get(fileId=file_id, fields=fields, supportsAllDrives=True)
+                     for file_id in unique_ids]
+    return dict(zip(unique_ids, DriveBatch(service).execute(requests_list)))
+
+
+class AsyncDriveEngine:
+    """Engine asyncio/aiohttp cho các thao tác nhỏ và nhiều: tải file nhỏ, tải lên multipart, sao chép.
+
+    Chạy một event loop riêng trong luồng nền; các coroutine được đưa vào bằng `submit` và trả về
+    `concurrent.futures.Future`, nên dùng được chung với pool luồng và `wait()` sẵn có. Mọi yêu cầu
+    đi qua một `ClientSession` với các kết nối keep-alive dùng chung và vẫn lấy token từ `drive_scheduler`,
+    nên hàng trăm file nhỏ chạy song song mà không cần hàng trăm luồng.
+    """
+    def __init__(self, creds, concurrency=ASYNC_CONCURRENCY):
+        if not HAS_AIOHTTP:
+            raise RuntimeError("Chưa cài aiohttp (pip install aiohttp), không dùng được engine asyncio.")
+        self.concurrency = concurrency
+        self._creds = creds
+        self._creds_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="drive-async", daemon=True)
+        self._thread.start()
+        self._session = self.run(self._open_session())
+
+    async def _open_session(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(sock_connect=DOWNLOAD_TIMEOUT[0], sock_read=DOWNLOAD_TIMEOUT[1])
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def close(self):
+        self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _auth_headers(self):
+        # Dùng lại credentials từ token pickle; làm mới token (khoảng mỗi giờ một lần) là thao tác đồng bộ ngắn
+        with self._creds_lock:
+            if not self._creds.valid:
+                self._creds.refresh(auth_requests.Request())
+            return {'Authorization': f'Bearer {self._creds.token}'}
+
+    async def _request(self, method, url, handler, data=None, **kwargs):
+        """Gửi yêu cầu qua token bucket, thử lại khi gặp lỗi tạm thời; `handler(response)` đọc kết quả.
+
+        `data` là hàm tạo body mới cho mỗi lần gửi (body multipart không gửi lại được).
+        """
+        for attempt in range(RETRY_ATTEMPTS):
+            await drive_scheduler.acquire_async()
+            error, quota = None, False
+            try:
+                async with self._semaphore:
+                    async with self._session.request(method, url, headers=self._auth_headers(),
+                                                     data=data() if data else None, **kwargs) as response:
+                        if response.status < 400:
+                            result = await handler(response)
+                            drive_scheduler.on_success()
+                            return result
+                        text = await response.text()
+                        error = IOError(f"HTTP {response.status} {method} {url}: {text[:200]}")
+                        quota = response.status == 429 or (
+                            response.status == 403 and any(reason in text for reason in RETRYABLE_REASONS))
+                        if response.status not in RETRYABLE_STATUSES and not quota:
+                            raise error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = IOError(f"{method} {url}: {e!r}")
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise error
+            await asyncio.sleep(drive_scheduler.retry_delay(attempt, quota))
+
+    async def download(self, file_id, part_path):
+        """Tải cả file vào `part_path`; trả về (số byte, MD5 hex) tính ngay trong lúc ghi."""
+        async def save(response):
+            md5 = hashlib.md5()
+            size = 0
+            # File nhỏ nên ghi thẳng trong event loop, không đáng đẩy sang luồng khác
+            with open(part_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+            return size, md5.hexdigest()
+
+        return await self._request('GET', f"{DRIVE_FILES_URL}/{file_id}", save,
+                                   params={'alt': 'media', 'supportsAllDrives': 'true'})
+
+    async def upload(self, file_path, parent_folder_id=None):
+        """Tải một file nhỏ lên bằng một request multipart; trả về metadata (id) của file mới."""
+        metadata = {'name': os.path.basename(file_path)}
+        if parent_folder_id:
+            metadata['parents'] = [parent_folder_id]
+        with open(file_path, 'rb') as f:
+            content = f.read()
+
+        def body():
+            writer = aiohttp.MultipartWriter('related')
+            writer.append_json(metadata)
+            writer.append(content, {'Content-Type': 'application/octet-stream'})
+            return writer
+
+        return await self._request('POST', DRIVE_UPLOAD_URL, self._json, data=body,
+                                   params={'uploadType': 'multipart', 'fields': 'id', 'supportsAllDrives': 'true'})
+
+    async def copy(self, file_id, name, parent_folder_id):
+        """Sao chép file ngay trên Drive (`files.copy`)."""
+        return await self._request('POST', f"{DRIVE_FILES_URL}/{file_id}/copy", self._json,
+                                   json={'name': name, 'parents': [parent_folder_id]},
+                                   params={'fields': 'id', 'supportsAllDrives': 'true'})
+
+    @staticmethod
+    async def _json(response):
+        return await response.json()
+
+
+def resolve_shortcuts(service, shortcuts):
+    """Metadata file/thư mục đích của các lối tắt (giữ tên của lối tắt), theo đúng thứ tự đầu vào.
+
+    Lối tắt trỏ tới mục đã bị xóa hoặc không có quyền truy cập cho kết quả None.
+    """
+    target_ids = [shortcut.get('shortcutDetails', {}).get('targetId') for shortcut in shortcuts]
+    targets = fetch_drive_metadata(service, [target_id for target_id in target_ids if target_id], fields=FILE_FIELDS)
+    resolved = []
+    for shortcut, target_id in zip(shortcuts, target_ids):
+        target, error = targets.get(target_id, (None, None))
+        if target is None:
+            print(f"Lối tắt {shortcut['name']} trỏ tới mục không truy cập được ({error}). Bỏ qua.")
+            resolved.append(None)
+        else:
+            resolved.append(dict(target, name=shortcut['name']))
+    return resolved
+
+
+def link_or_copy(source_path, target_path):
+    """Tạo `target_path` có cùng nội dung với `source_path` mà không tải lại.
+
+    Ưu tiên hardlink (không tốn thêm dung lượng); nếu ổ đĩa không hỗ trợ hoặc khác ổ thì chép
+    file trên máy. Trả về True nếu tạo được hardlink.
+    """
+    tmp_path = target_path + PART_SUFFIX
+    for stale in (tmp_path, tmp_path + STATE_SUFFIX):
+        if os.path.exists(stale):
+            os.remove(stale)
+    try:
+        os.link(source_path, tmp_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(source_path, tmp_path)
+        linked = False
+    os.replace(tmp_path, target_path)
+    return linked
+
+
+class DedupRegistry:
+    """Sổ đăng ký theo job: ID file Drive và (md5Checksum, size) -> bản đã tải trên máy.
+
+    Luồng đầu tiên gặp một nội dung sẽ tải nó; các luồng khác gặp cùng nội dung (cùng ID qua
+    link chồng nhau hoặc lối tắt, hay cùng MD5) chờ bản đó tải xong rồi tạo liên kết tới nó.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    @staticmethod
+    def _keys(source_file):
+        keys = [('id', source_file['id'])]
+        if source_file.get('md5Checksum'):
+            keys.append(('md5', source_file['md5Checksum'], source_file.get('size')))
+        return keys
+
+    def _find_locked(self, keys):
+        return next((self._slots[key] for key in keys if key in self._slots), None)
+
+    def claim(self, source_file):
+        """Đường dẫn bản đã tải để liên kết tới, hoặc None nếu luồng gọi phải tự tải rồi gọi `release`."""
+        keys = self._keys(source_file)
+        while True:
+            with self._lock:
+                slot = self._find_locked(keys)
+                if slot is None or (slot['done'].is_set() and not os.path.exists(slot['path'])):
+                    slot = {'done': threading.Event(), 'path': None}
+                    for key in keys:
+                        self._slots[key] = slot
+                    return None
+            # Có thể một luồng khác đang tải đúng nội dung này; nếu nó lỗi thì vòng sau luồng này nhận tải
+            slot['done'].wait()
+            if slot['path'] is not None:
+                return slot['path']
+
+    def find(self, source_file):
+        """Như `claim` nhưng không chờ và không nhận tải (dùng trong engine asyncio)."""
+        with self._lock:
+            slot = self._find_locked(self._keys(source_file))
+        if slot is not None and slot['done'].is_set() and os.path.exists(slot['path']):
+            return slot['path']
+        return None
+
+    def release(self, source_file, path):
+        """Ghi nhận bản trên máy của `source_file` (path=None: tải lỗi, luồng đang chờ sẽ tự tải)."""
+        keys = self._keys(source_file)
+        with self._lock:
+            slot = self._find_locked(keys)
+            if slot is not None and slot['done'].is_set():
+                if path is None or os.path.exists(slot['path']):
+                    return
+                slot = None
+            if path is None:
+                for key in keys:
+                    if self._slots.get(key) is slot:
+                        del self._slots[key]
+            else:
+                if slot is None:
+                    slot = {'done': threading.Event(), 'path': None}
+                slot['path'] = path
+                for key in keys:
+                    self._slots.setdefault(key, slot)
+        if slot is not None:
+            slot['done'].set()
+
+
+class PrefixHasher:
+    """Băm MD5 phần đầu liên tục của file trong lúc các đoạn đang tải song song.
+
+    MD5 chỉ băm được theo thứ tự, nên chỉ dữ liệu nối tiếp đúng chỗ đã băm (thường là đoạn đầu)
+    được băm ngay từ bộ nhớ khi vừa nhận. `finish()` chỉ đọc lại từ đĩa phần còn lại sau đó.
+    """
+    def __init__(self, md5=None, hashed=0):
+        self._lock = threading.Lock()
+        self._md5 = md5 if md5 is not None else hashlib.md5()
+        self.hashed = hashed  # Số byte đầu file đã băm
+
+    def feed(self, offset, chunk):
+        with self._lock:
+            if offset == self.hashed:
+                self._md5.update(chunk)
+                self.hashed += len(chunk)
+
+    def finish(self, path, total_size):
+        """Băm nốt phần chưa băm từ đĩa; trả về (MD5 dạng hex, số byte phải đọc lại)."""
+        with self._lock:
+            reread = total_size - self.hashed
+            if reread > 0:
+                hash_file(path, reread, self._md5, self.hashed)
+                self.hashed = total_size
+            return self._md5.hexdigest(), max(reread, 0)
+
+
+class ChecksumMismatch(IOError):
+    """MD5 của file vừa tải không khớp với `md5Checksum` trên Drive."""
+
+
+class TransferProgress:
+    """Theo dõi tiến độ chung của cả job tải, dùng chung giữa các luồng."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.files_linked = 0
+        self.bytes_done = 0
+        self.bytes_linked = 0
+        self.failed_names = []
+
+    def add_done(self, size):
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+
+    def add_skipped(self):
+        with self._lock:
+            self.files_skipped += 1
+
+    def add_linked(self, size):
+        with self._lock:
+            self.files_linked += 1
+            self.bytes_linked += size
+
+    def add_failed(self, file_name):
+        with self._lock:
+            self.files_failed += 1
+            self.failed_names.append(file_name)
+
+    def summary(self):
+        with self._lock:
+            elapsed = max(time.time() - self.start_time, 0.001)
+            size_mb = self.bytes_done / (1024 * 1024)
+            message = (f"Tổng cộng: {self.files_done} tệp đã tải ({size_mb:0.2f} MB), "
+                       f"{self.files_skipped} tệp bỏ qua, {self.files_failed} tệp lỗi. "
+                       f"Thời gian {int(elapsed)} giây. Tốc độ {size_mb / elapsed:0.2f} MB/s")
+            if self.files_linked:
+                message += (f"\n{self.files_linked} tệp trùng nội dung được liên kết tới bản đã tải "
+                            f"({self.bytes_linked / (1024 * 1024):0.2f} MB không phải tải lại).")
+            if self.failed_names:
+                message += "\nCác tệp bị lỗi: " + ", ".join(self.failed_names)
+            return message
+
+    def as_dict(self):
+        with self._lock:
+            return {'files_done': self.files_done, 'files_skipped': self.files_skipped,
+                    'files_failed': self.files_failed, 'files_linked': self.files_linked,
+                    'bytes_done': self.bytes_done, 'bytes_linked': self.bytes_linked,
+                    'seconds': round(time.time() - self.start_time, 3)}
+
+
+class JobInterrupted(Exception):
+    """Job bị tạm dừng hoặc hủy giữa chừng; `args[0]` là trạng thái mới (JOB_PAUSED/JOB_CANCELLED)."""
+
+
+class JobControl:
+    """Cờ dừng của một job, được các luồng tải kiểm tra giữa các file và giữa các chunk."""
+    def __init__(self):
+        self.reason = None
+
+    def stop(self, reason):
+        self.reason = reason
+
+    def check(self):
+        if self.reason is not None:
+            raise JobInterrupted(self.reason)
+
+
+class JsonLinesEvents:
+    """Ghi sự kiện tiến độ ra stream, mỗi sự kiện một dòng JSON (dùng cho chế độ dòng lệnh)."""
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event, **fields):
+        line = json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+class FilterSpec:
+    """Bộ lọc file khi liệt kê thư mục Drive: tên (glob), đuôi file, MIME type, kích thước, ngày sửa.
+
+    Phần nào diễn đạt được bằng truy vấn `q` của Drive (MIME type, ngày sửa, loại trừ theo chuỗi,
+    tiền tố tên) được đưa vào `query_clauses()` để file bị loại không bao giờ được liệt kê. Phần còn
+    lại (glob tổng quát, đuôi file, kích thước) được `matches()` kiểm tra trên máy. Thư mục và lối tắt
+    luôn được giữ lại trong truy vấn (trừ khi bị loại trừ theo tên) để vẫn duyệt được vào bên trong;
+    lối tắt được kiểm tra lại theo file đích sau khi phân giải.
+    """
+    def __init__(self, include_names=(), exclude_names=(), extensions=(), mime_types=(),
+                 min_size=None, max_size=None, modified_after=None):
+        self.include_names = [pattern.lower() for pattern in include_names]
+        self.exclude_names = [pattern.lower() for pattern in exclude_names]
+        self.extensions = ['.' + ext.lower().lstrip('.') for ext in extensions]
+        self.mime_types = [mime.lower() for mime in mime_types]
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after  # datetime có múi giờ (UTC)
+
+    @classmethod
+    def parse(cls, include_names="", exclude_names="", extensions="", mime_types="",
+              min_size_mb=None, max_size_mb=None, modified_after=""):
+        """Tạo bộ lọc từ các ô nhập (danh sách cách nhau bởi dấu phẩy, kích thước theo MB,
+        ngày dạng YYYY-MM-DD). Báo ValueError nếu ngày không hợp lệ."""
+        def split(value):
+            return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+        def size(value):
+            return int(float(value) * 1024 * 1024) if value not in (None, "") and float(value) > 0 else None
+
+        cutoff = None
+        if modified_after and modified_after.strip():
+            try:
+                cutoff = datetime.datetime.fromisoformat(modified_after.strip().replace('Z', '+00:00'))
+            except ValueError:
+                raise ValueError(f"Ngày '{modified_after}' không hợp lệ, vui lòng nhập dạng YYYY-MM-DD.")
+            if cutoff.tzinfo is None:
+                cutoff = cutoff.replace(tzinfo=datetime.timezone.utc)
+        return cls(split(include_names), split(exclude_names), split(extensions), split(mime_types),
+                   size(min_size_mb), size(max_size_mb), cutoff)
+
+    @property
+    def active(self):
+        return bool(self.include_names or self.exclude_names or self.extensions or self.mime_types
+                    or self.min_size or self.max_size or self.modified_after)
+
+    @staticmethod
+    def _quote(value):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+    @staticmethod
+    def _literal(pattern, prefix_only=False):
+        """Phần chữ của mẫu dạng `abc*` (prefix_only) hoặc dạng "chứa chuỗi" (`abc`, `*abc*`); None nếu không phải."""
+        if prefix_only:
+            core = pattern[:-1] if pattern.endswith('*') else None
+        elif pattern.startswith('*') and pattern.endswith('*'):
+            core = pattern.strip('*')
+        else:
+            core = pattern
+        if not core or any(char in core for char in '*?['):
+            return None
+        return core
+
+    def query_clauses(self):
+        """Các điều kiện thêm vào truy vấn `q` của files().list.
+
+        `name contains` của Drive chỉ khớp tiền tố của từng từ trong tên, nên điều kiện gửi lên
+        máy chủ luôn rộng hơn (hoặc bằng) bộ lọc thật; `matches()` vẫn kiểm tra lại trên máy.
+        """
+        folder = f"mimeType = '{FOLDER_MIME_TYPE}' or mimeType = '{SHORTCUT_MIME_TYPE}'"
+        clauses = []
+        for pattern in self.exclude_names:
+            # Tên chứa chuỗi theo tiền tố từ thì chắc chắn cũng chứa chuỗi đó, loại trên máy chủ là an toàn
+            literal = self._literal(pattern)
+            if literal is not None:
+                clauses.append(f"not name contains {self._quote(literal)}")
+        prefixes = [self._literal(pattern, prefix_only=True) for pattern in self.include_names]
+        if prefixes and all(prefixes):
+            names = " or ".join(f"name contains {self._quote(prefix)}" for prefix in prefixes)
+            clauses.append(f"({names} or {folder})")
+        if self.mime_types:
+            mimes = " or ".join(f"mimeType contains {self._quote(mime[:-1])}" if mime.endswith('/*')
+                                else f"mimeType = {self._quote(mime)}" for mime in self.mime_types)
+            clauses.append(f"({mimes} or {folder})")
+        if self.modified_after is not None:
+            # modifiedTime của thư mục không đổi khi file bên trong đổi, nên thư mục luôn được giữ
+            stamp = self.modified_after.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            clauses.append(f"(modifiedTime > '{stamp}' or {folder})")
+        return clauses
+
+    @staticmethod
+    def _name_matches(name, patterns):
+        # Mẫu không có ký tự glob được hiểu là "tên chứa chuỗi này"
+        return any(fnmatch.fnmatchcase(name, pattern if any(char in pattern for char in '*?[') else f"*{pattern}*")
+                   for pattern in patterns)
+
+    def matches(self, file):
+        """Kiểm tra trên máy một mục vừa liệt kê; thư mục chỉ bị loại khi trùng mẫu loại trừ."""
+        name = file['name'].lower()
+        if self._name_matches(name, self.exclude_names):
+            return False
+        if file['mimeType'] in (FOLDER_MIME_TYPE, SHORTCUT_MIME_TYPE):
+            return True
+        if self.include_names and not self._name_matches(name, self.include_names):
+            return False
+        if self.extensions and not name.endswith(tuple(self.extensions)):
+            return False
+        mime_type = file['mimeType'].lower()
+        if self.mime_types and not any(mime_type.startswith(mime[:-1]) if mime.endswith('/*') else mime_type == mime
+                                       for mime in self.mime_types):
+            return False
+        size = int(file.get('size') or 0)
+        if (self.min_size and size < self.min_size) or (self.max_size and size > self.max_size):
+            return False
+        if self.modified_after is not None and file.get('modifiedTime'):
+            modified = datetime.datetime.fromisoformat(file['modifiedTime'].replace('Z', '+00:00'))
+            if modified <= self.modified_after:
+                return False
+        return True
+
+
+_WALK_DONE = object()  # Đánh dấu luồng liệt kê đã duyệt hết cây thư mục
+
+
+class DriveWalker:
+    """Duyệt cây thư mục Drive theo từng cấp, không đệ quy, trong một luồng nền.
+
+    Các thư mục cùng cấp được gộp vào chung một truy vấn `files().list`, nên số lần gọi API
+    tỉ lệ với số cấp của cây thay vì số thư mục. File được trả về qua một hàng đợi có giới hạn,
+    nên việc liệt kê chạy song song với việc tải mà bộ nhớ không tăng theo số file trong cây.
+    """
+    def __init__(self, service_factory, filter_spec=None, queue_size=WALK_QUEUE_SIZE, cache=None,
+                 follow_shortcuts=False):
+        # service_factory được gọi trong luồng liệt kê để lấy service riêng cho luồng đó
+        self._service_factory = service_factory
+        # Thay lối tắt bằng file/thư mục đích; tắt khi cần thấy đúng các mục có trong thư mục
+        self._follow_shortcuts = follow_shortcuts
+        self._filter = filter_spec if filter_spec is not None and filter_spec.active else None
+        self._queue_size = queue_size
+        # `cache` (ListingCache) lưu kết quả liệt kê theo thư mục; mỗi bộ lọc có bản lưu riêng
+        self._cache = cache
+        self._cache_key = " and ".join(self._filter.query_clauses()) if self._filter is not None else ""
+
+    def build_query(self, folder_ids):
+        """Truy vấn lấy các mục con của nhiều thư mục cùng lúc: ('a' in parents or 'b' in parents ...)."""
+        parents = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+        query = f"({parents}) and trashed = false"
+        if self._filter is not None:
+            query = " and ".join([query] + self._filter.query_clauses())
+        return query
+
+    def list_children(self, service, folder_ids):
+        """Liệt kê các mục con trực tiếp của các thư mục `folder_ids`, tự lật qua các trang kết quả."""
+        query = self.build_query(folder_ids)
+        page_token = None
+        while True:
+            response = drive_scheduler.execute(service.files().list(q=query, pageSize=LIST_PAGE_SIZE,
+                                                                    fields=LIST_FIELDS, pageToken=page_token,
+                                                                    supportsAllDrives=True,
+                                                                    includeItemsFromAllDrives=True))
+            for file in response.get('files', []):
+                yield file
+
+            page_token = response.get('nextPageToken', None)
+            if page_token is None:
+                break
+
+    def _accept(self, file):
+        # Phần bộ lọc không diễn đạt được bằng `q` được kiểm tra ở đây
+        return self._filter is None or self._filter.matches(file)
+
+    def list_level(self, service, level):
+        """Liệt kê một cấp của cây. `level` là danh sách (folder_id, context, modifiedTime);
+        sinh ra các cặp (context của thư mục cha, mục con).
+
+        Thư mục có bản lưu còn hạn trong cache và `modifiedTime` không đổi thì không gọi API;
+        các thư mục còn lại được liệt kê rồi lưu vào cache.
+        """
+        pending = []
+        for folder_id, context, modified_time in level:
+            children = self._cache.get(folder_id, self._cache_key, modified_time) if self._cache is not None else None
+            if children is None:
+                pending.append((folder_id, context, modified_time))
+                continue
+            for file in children:
+                if self._accept(file):
+                    yield context, file
+
+        for i in range(0, len(pending), LIST_PARENTS_PER_QUERY):
+            group = pending[i:i + LIST_PARENTS_PER_QUERY]
+            contexts = {folder_id: context for folder_id, context, _ in group}
+            listed = {folder_id: [] for folder_id in contexts} if self._cache is not None else None
+            for file in self.list_children(service, list(contexts)):
+                # Dùng `parents` để biết mục con thuộc thư mục nào trong nhóm vừa truy vấn
+                for parent_id in file.get('parents', []):
+                    if parent_id in contexts:
+                        if listed is not None:
+                            listed[parent_id].append(file)
+                        if self._accept(file):
+                            yield contexts[parent_id], file
+                        break
+            if listed is not None:
+                # Chỉ lưu khi đã lật hết các trang, danh sách dở dang không được dùng lại
+                for folder_id, _, modified_time in group:
+                    self._cache.put(folder_id, self._cache_key, modified_time, listed[folder_id])
+
+    def walk(self, root_id, root_context, on_folder, root_modified=None):
+        """Sinh ra các cặp (context, file) cho mọi file trong cây của `root_id`.
+
+        `on_folder(folder, parent_context)` được gọi trong luồng liệt kê cho mỗi thư mục con
+        và trả về context (ví dụ đường dẫn trên máy) gắn cho các mục bên trong thư mục đó.
+        `root_modified` là `modifiedTime` của `root_id`, dùng để kiểm tra bản lưu trong cache.
+        """
+        items = queue.Queue(maxsize=self._queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            # Không chặn mãi nếu phía tiêu thụ đã dừng giữa chừng
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce():
+            try:
+                service = self._service_factory()
+                level = [(root_id, root_context, root_modified)]
+                # Lối tắt có thể trỏ ngược lên thư mục cha hoặc tới thư mục đã duyệt: mỗi thư mục chỉ duyệt một lần
+                visited = {root_id}
+
+                def visit(context, file):
+                    if file['mimeType'] != FOLDER_MIME_TYPE:
+                        put((context, file))
+                    elif file['id'] in visited:
+                        print(f"Thư mục {file['name']} đã được duyệt ở chỗ khác trong cây. Bỏ qua.")
+                    else:
+                        visited.add(file['id'])
+                        next_level.append((file['id'], on_folder(file, context), file.get('modifiedTime')))
+
+                while level and not stop.is_set():
+                    next_level = []
+                    shortcuts = []
+                    for context, file in self.list_level(service, level):
+                        if stop.is_set():
+                            break
+                        if self._follow_shortcuts and file['mimeType'] == SHORTCUT_MIME_TYPE:
+                            shortcuts.append((context, file))
+                        else:
+                            visit(context, file)
+                    if shortcuts and not stop.is_set():
+                        # Metadata của mọi file đích trong cấp này được lấy chung bằng batch
+                        for (context, _), target in zip(shortcuts, resolve_shortcuts(service, [file for _, file in shortcuts])):
+                            if target is not None and self._accept(target):
+                                visit(context, target)
+                    level = next_level
+                put(_WALK_DONE)
+            except BaseException as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, name="drive-walker", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = items.get()
+                if item is _WALK_DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+
+class PartState:
+    """Trạng thái của một file `.part` đang tải: ID file, kích thước mong đợi và số byte đã nhận
+    của từng đoạn [start, end, received]. Được lưu cạnh file `.part` để tải tiếp sau khi bị ngắt."""
+    def __init__(self, path, file_id, size, segments):
+        self.path = path
+        self.file_id = file_id
+        self.size = size
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._last_save = 0
+
+    @classmethod
+    def load(cls, path, file_id, size):
+        """Đọc trạng thái cũ; trả về None nếu không có hoặc không còn khớp với file trên Drive."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('id') != file_id or data.get('size') != size:
+            return None
+        return cls(path, file_id, size, data['segments'])
+
+    def received(self):
+        with self._lock:
+            return sum(received for _, _, received in self.segments)
+
+    def update(self, index, received, force=False):
+        with self._lock:
+            self.segments[index][2] = received
+            if force or time.time() - self._last_save >= 1:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        data = {'id': self.file_id, 'size': self.size,
+                'received': sum(received for _, _, received in self.segments), 'segments': self.segments}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.time()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DiskWriter:
+    """Luồng ghi đĩa riêng cho mọi luồng tải: mạng và đĩa chạy song song thay vì luân phiên.
+
+    Luồng tải chép dữ liệu vào các buffer cấp phát sẵn, đầy buffer nào thì đưa sang luồng ghi
+    buffer đó rồi đọc mạng tiếp. Số buffer có giới hạn nên RAM dùng cố định; khi đĩa chậm hơn
+    mạng, luồng tải phải chờ buffer được trả lại.
+    """
+    def __init__(self, buffer_count=WRITE_BUFFER_COUNT, buffer_size=WRITE_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._free = queue.Queue()
+        for _ in range(buffer_count):
+            self._free.put(bytearray(buffer_size))
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="disk-writer", daemon=True)
+        self._thread.start()
+
+    def open(self, path, offset=0, mode='r+b'):
+        """Mở `path` để ghi tuần tự từ `offset`; trả về `WriteStream` (dùng được như file cho MediaIoBaseDownload)."""
+        return WriteStream(self, open(path, mode), offset)
+
+    def acquire(self):
+        return self._free.get()
+
+    def submit(self, stream, offset, buffer, length, on_written=None):
+        self._jobs.put((stream, offset, buffer, length, on_written))
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            stream, offset, buffer, length, on_written = job
+            try:
+                if stream.error is None:
+                    if buffer is not None:
+                        stream.file.seek(offset)
+                        stream.file.write(memoryview(buffer)[:length])
+                    if on_written is not None:
+                        # Dữ liệu phải xuống đĩa trước khi được ghi nhận vào tệp trạng thái
+                        stream.file.flush()
+                        on_written()
+            except OSError as e:
+                stream.error = e
+            finally:
+                if buffer is not None:
+                    self._free.put(buffer)
+                stream.job_done()
+
+
+class WriteStream:
+    """Một file đang được `DiskWriter` ghi; `write()` chỉ chép vào buffer rồi trả về ngay."""
+    def __init__(self, writer, file, offset):
+        self.file = file
+        self.error = None
+        self._writer = writer
+        self._offset = offset
+        self._buffer = None
+        self._filled = 0
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        data = memoryview(data)
+        size = len(data)
+        while data:
+            if self._buffer is None:
+                self._buffer = self._writer.acquire()
+            count = min(len(data), len(self._buffer) - self._filled)
+            self._buffer[self._filled:self._filled + count] = data[:count]
+            self._filled += count
+            data = data[count:]
+            if self._filled == len(self._buffer):
+                self._submit()
+        return size
+
+    def flush(self, on_written=None):
+        """Đẩy phần buffer còn dở sang luồng ghi; `on_written()` chạy khi mọi byte tới giờ đã xuống đĩa."""
+        self._submit(on_written)
+
+    def close(self):
+        """Chờ luồng ghi ghi hết rồi đóng file; báo lại lỗi ghi nếu có."""
+        try:
+            self._submit()
+            with self._cond:
+                while self._pending:
+                    self._cond.wait()
+        finally:
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def job_done(self):
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _submit(self, on_written=None):
+        if self._filled == 0 and on_written is None:
+            return
+        buffer, length = self._buffer, self._filled
+        with self._cond:
+            self._pending += 1
+        self._writer.submit(self, self._offset, buffer, length, on_written)
+        self._offset += length
+        self._buffer = None
+        self._filled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TransferPlan:
+    """Kế hoạch tải: chọn file theo thứ tự mong muốn trong ngân sách dung lượng.
+
+    `build()` lập kế hoạch trước cho cả danh sách (thứ tự nhỏ/lớn trước). Với thứ tự liệt kê,
+    `admit()` xét từng file ngay khi được liệt kê nên không phải giữ cả cây trong bộ nhớ.
+    """
+    def __init__(self, budget_bytes=0, order=PLAN_ORDER_LISTING):
+        self.budget_bytes = budget_bytes  # 0 là không giới hạn
+        self.order = order
+        self.selected = []
+        self.skipped = []
+        self.selected_count = self.selected_bytes = 0
+        self.skipped_count = self.skipped_bytes = 0
+
+    def build(self, candidates):
+        """`candidates` là danh sách (số byte cần tải, thư mục đích, file)."""
+        if self.order == PLAN_ORDER_SMALLEST:
+            candidates = sorted(candidates, key=lambda item: item[0])
+        elif self.order == PLAN_ORDER_LARGEST:
+            candidates = sorted(candidates, key=lambda item: item[0], reverse=True)
+
+        for candidate in candidates:
+            self.admit(candidate, keep=True)
+
+    def admit(self, candidate, keep=False):
+        """Xét một file (số byte cần tải, thư mục đích, file); trả về True nếu còn vừa ngân sách.
+
+        Chỉ giữ danh sách file khi `keep=True`, còn lại chỉ cộng dồn số tệp và số byte.
+        """
+        cost = candidate[0]
+        # Bỏ qua file không vừa ngân sách nhưng vẫn xét tiếp các file nhỏ hơn phía sau
+        if self.budget_bytes > 0 and self.selected_bytes + cost > self.budget_bytes:
+            self.skipped_count += 1
+            self.skipped_bytes += cost
+            if keep:
+                self.skipped.append(candidate)
+            return False
+        self.selected_count += 1
+        self.selected_bytes += cost
+        if keep:
+            self.selected.append(candidate)
+        return True
+
+    def summary(self):
+        gb = 1024 ** 3
+        message = f"Kế hoạch: tải {self.selected_count} tệp ({self.selected_bytes / gb:0.2f} GB)"
+        if self.budget_bytes > 0:
+            message += f" trong giới hạn {self.budget_bytes / gb:0.2f} GB"
+        if self.skipped_count:
+            message += f", bỏ qua {self.skipped_count} tệp ({self.skipped_bytes / gb:0.2f} GB) vì vượt giới hạn"
+        return message + "."
+
+
+class SyncIndex:
+    """Chỉ mục SQLite trong thư mục tải về, ghi lại các file đã tải theo ID trên Drive.
+
+    Nhờ đó lần tải lại chỉ tải file mới hoặc đã thay đổi (so `md5Checksum`/`modifiedTime`),
+    và file bị đổi tên/di chuyển trên Drive được di chuyển trên máy thay vì tải lại.
+    Một ID có thể có nhiều bản trên máy (link chồng nhau, lối tắt), mỗi bản là một dòng (file_id, path).
+    """
+    def __init__(self, root_folder):
+        self.root = root_folder
+        os.makedirs(root_folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # Dùng chung một kết nối giữa các luồng tải, mọi truy cập đều đi qua self._lock
+        self._conn = sqlite3.connect(os.path.join(root_folder, INDEX_FILE_NAME), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._migrate_files_table()
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " file_id TEXT NOT NULL, path TEXT NOT NULL, size INTEGER,"
+                " md5 TEXT, modified_time TEXT, PRIMARY KEY (file_id, path))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_path ON files(path)")
+            # Thư mục đã tạo trên máy, dùng để biết một thay đổi có thuộc cây đã đồng bộ hay không
+            self._conn.execute("CREATE TABLE IF NOT EXISTS folders (folder_id TEXT PRIMARY KEY, path TEXT NOT NULL)")
+            # Checkpoint của luồng thay đổi (changes feed) cho từng thư mục gốc đã đồng bộ
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " root_id TEXT PRIMARY KEY, page_token TEXT NOT NULL, drive_id TEXT)"
+            )
+
+    def _migrate_files_table(self):
+        # Chỉ mục cũ chỉ giữ một đường dẫn cho mỗi ID (file_id PRIMARY KEY): chuyển sang khóa (file_id, path)
+        columns = self._conn.execute("PRAGMA table_info(files)").fetchall()
+        if [column['name'] for column in columns if column['pk']] != ['file_id']:
+            return
+        self._conn.execute("ALTER TABLE files RENAME TO files_old")
+        self._conn.execute(
+            "CREATE TABLE files ("
+            " file_id TEXT NOT NULL, path TEXT NOT NULL, size INTEGER,"
+            " md5 TEXT, modified_time TEXT, PRIMARY KEY (file_id, path))"
+        )
+        self._conn.execute("INSERT INTO files SELECT file_id, path, size, md5, modified_time FROM files_old")
+        self._conn.execute("DROP TABLE files_old")
+
+    def abspath(self, relative_path):
+        return os.path.join(self.root, relative_path)
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.root)
+
+    def get(self, file_id, local_path=None):
+        """Bản ghi của file `file_id`, ưu tiên bản ở `local_path` nếu có."""
+        relative_path = self.relpath(local_path) if local_path is not None else None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE file_id = ? ORDER BY path = ? DESC",
+                                     (file_id, relative_path)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_all(self, file_id):
+        with self._lock:
+            return [dict(row) for row in
+                    self._conn.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchall()]
+
+    def record(self, source_file, local_path):
+        size = source_file.get('size')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_id, path, size, md5, modified_time) VALUES (?, ?, ?, ?, ?)",
+                (source_file['id'], self.relpath(local_path), int(size) if size is not None else None,
+                 source_file.get('md5Checksum'), source_file.get('modifiedTime'))
+            )
+
+    def entries(self):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM files").fetchall()]
+
+    def set_md5(self, file_id, md5, relative_path):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET md5 = ? WHERE file_id = ? AND path = ?", (md5, file_id, relative_path))
+
+    def forget(self, file_id, relative_path=None):
+        """Bỏ bản ghi ở `relative_path`, hoặc mọi bản ghi của `file_id` nếu không chỉ đường dẫn."""
+        with self._lock, self._conn:
+            if relative_path is None:
+                self._conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            else:
+                self._conn.execute("DELETE FROM files WHERE file_id = ? AND path = ?", (file_id, relative_path))
+
+    def discard_stale_copy(self, entry, file_id, new_path):
+        """Xóa bản cũ của file đã tải lại ở chỗ khác, nếu đường dẫn cũ không thuộc về file nào khác."""
+        old_path = self.abspath(entry['path'])
+        if os.path.normcase(os.path.abspath(old_path)) == os.path.normcase(os.path.abspath(new_path)):
+            return
+        self.forget(file_id, entry['path'])
+        with self._lock:
+            in_use = self._conn.execute("SELECT 1 FROM files WHERE path = ? AND file_id != ?",
+                                        (entry['path'], file_id)).fetchone()
+        if not in_use and os.path.exists(old_path):
+            os.remove(old_path)
+
+    def record_folder(self, folder_id, local_path):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO folders (folder_id, path) VALUES (?, ?)",
+                               (folder_id, self.relpath(local_path)))
+
+    def get_folder_path(self, folder_id):
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM folders WHERE folder_id = ?", (folder_id,)).fetchone()
+        return self.abspath(row['path']) if row is not None else None
+
+    def _subtree_rows(self, table, relative_path):
+        prefix = relative_path + os.sep
+        rows = self._conn.execute(f"SELECT rowid, path FROM {table}").fetchall()
+        return [row for row in rows if row['path'] == relative_path or row['path'].startswith(prefix)]
+
+    def move_tree(self, old_path, new_path):
+        """Cập nhật đường dẫn của mọi file/thư mục nằm dưới `old_path` sau khi thư mục bị di chuyển."""
+        old_relative, new_relative = self.relpath(old_path), self.relpath(new_path)
+        with self._lock, self._conn:
+            for table in ("files", "folders"):
+                for row in self._subtree_rows(table, old_relative):
+                    self._conn.execute(f"UPDATE {table} SET path = ? WHERE rowid = ?",
+                                       (new_relative + row['path'][len(old_relative):], row['rowid']))
+
+    def remove_tree(self, folder_path):
+        """Bỏ mọi bản ghi nằm dưới `folder_path`; trả về đường dẫn các file cần xóa trên máy."""
+        relative_path = self.relpath(folder_path)
+        with self._lock, self._conn:
+            files = self._subtree_rows("files", relative_path)
+            for table in ("files", "folders"):
+                for row in self._subtree_rows(table, relative_path):
+                    self._conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (row['rowid'],))
+        return [self.abspath(row['path']) for row in files]
+
+    def is_root(self, item_id):
+        """True nếu mục là gốc của một link đã tải (nằm ngay trong thư mục tải về hoặc có checkpoint).
+
+        Cha của mục gốc không bao giờ được ghi vào chỉ mục, nên thay đổi của nó không được coi là
+        "đã ra khỏi cây đã đồng bộ".
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM checkpoints WHERE root_id = ?", (item_id,)).fetchone():
+                return True
+            rows = self._conn.execute("SELECT path FROM folders WHERE folder_id = ? UNION ALL "
+                                      "SELECT path FROM files WHERE file_id = ?", (item_id, item_id)).fetchall()
+        return any(os.sep not in row['path'] for row in rows)
+
+    def get_checkpoint(self, root_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM checkpoints WHERE root_id = ?", (root_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def set_checkpoint(self, root_id, page_token, drive_id=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints (root_id, page_token, drive_id) VALUES (?, ?, ?)",
+                               (root_id, page_token, drive_id))
+
+    @staticmethod
+    def is_unchanged(entry, source_file):
+        """So sánh bản ghi trong chỉ mục với metadata hiện tại trên Drive."""
+        if entry['md5'] and source_file.get('md5Checksum'):
+            return entry['md5'] == source_file['md5Checksum']
+        size = source_file.get('size')
+        return (entry['modified_time'] == source_file.get('modifiedTime')
+                and entry['size'] == (int(size) if size is not None else None))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HashCache:
+    """Lưu MD5 của file trên máy theo (đường dẫn, kích thước, mtime) để lần đồng bộ sau không phải đọc lại file."""
+    def __init__(self, path=HASH_CACHE_FILE):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, md5 TEXT NOT NULL)"
+            )
+
+    def get(self, path, stat):
+        """MD5 đã lưu, hoặc None nếu chưa băm hay file đã thay đổi kể từ lần băm trước."""
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, md5 FROM hashes WHERE path = ?",
+                                     (os.path.abspath(path),)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        return None
+
+    def put(self, path, stat, md5):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO hashes (path, size, mtime_ns, md5) VALUES (?, ?, ?, ?)",
+                               (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, md5))
+
+    def hash_files(self, paths, workers=None):
+        """Trả về dict đường dẫn -> MD5; file chưa có trong cache được băm song song trên nhiều nhân CPU."""
+        result = {}
+        missing = []
+        for path in paths:
+            stat = os.stat(path)
+            md5 = self.get(path, stat)
+            if md5 is None:
+                missing.append((path, stat))
+            else:
+                result[path] = md5
+
+        if missing:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                digests = pool.map(file_md5, [path for path, _ in missing], chunksize=8)
+                for (path, stat), digest in zip(missing, digests):
+                    self.put(path, stat, digest)
+                    result[path] = digest
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ListingCache:
+    """Cache SQLite các lần liệt kê thư mục Drive, theo (ID thư mục, bộ lọc).
+
+    Bản lưu chỉ được dùng khi còn trong `ttl` giây và `modifiedTime` hiện tại của thư mục (lấy từ
+    lần liệt kê thư mục cha) trùng với lúc lưu. Drive không phải lúc nào cũng đổi `modifiedTime`
+    của thư mục khi file bên trong thay đổi, nên `ttl` là giới hạn độ cũ tối đa của danh sách.
+    Khi tổng dung lượng vượt `max_bytes`, các mục lâu không được dùng nhất bị xóa trước.
+    """
+    def __init__(self, ttl, path=LISTING_CACHE_FILE, max_bytes=LISTING_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                " folder_id TEXT NOT NULL, filter_key TEXT NOT NULL, modified_time TEXT,"
+                " fetched_at REAL NOT NULL, last_used REAL NOT NULL, files TEXT NOT NULL,"
+                " PRIMARY KEY (folder_id, filter_key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS listings_last_used ON listings(last_used)")
+        self._bytes = self._total_bytes()
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(files)), 0) FROM listings").fetchone()[0]
+
+    def get(self, folder_id, filter_key, modified_time):
+        """Danh sách mục con đã lưu, hoặc None nếu chưa có, đã hết hạn hay thư mục đã thay đổi."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT modified_time, fetched_at, files FROM listings"
+                                     " WHERE folder_id = ? AND filter_key = ?", (folder_id, filter_key)).fetchone()
+            if (row is None or modified_time is None or row[0] != modified_time
+                    or now - row[1] >= self.ttl):
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE listings SET last_used = ? WHERE folder_id = ? AND filter_key = ?",
+                                   (now, folder_id, filter_key))
+            self.hits += 1
+        return json.loads(row[2])
+
+    def put(self, folder_id, filter_key, modified_time, files):
+        data = json.dumps(files, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        with self._lock, self._conn:
+            old = self._conn.execute("SELECT LENGTH(files) FROM listings WHERE folder_id = ? AND filter_key = ?",
+                                     (folder_id, filter_key)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO listings (folder_id, filter_key, modified_time, fetched_at, last_used, files)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (folder_id, filter_key, modified_time, now, now, data))
+            self._bytes += len(data) - (old[0] if old is not None else 0)
+            if self._bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        # Xóa dần các mục lâu không dùng nhất cho tới khi còn dưới 90% giới hạn
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT rowid, LENGTH(files) FROM listings ORDER BY last_used").fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if self._bytes <= target:
+                break
+            evicted.append((rowid,))
+            self._bytes -= size
+        self._conn.executemany("DELETE FROM listings WHERE rowid = ?", evicted)
+
+    def invalidate(self, folder_ids=None):
+        """Xóa bản lưu của các thư mục `folder_ids` (mọi bộ lọc), hoặc toàn bộ cache; trả về số mục đã xóa."""
+        with self._lock, self._conn:
+            if folder_ids is None:
+                removed = self._conn.execute("DELETE FROM listings").rowcount
+            else:
+                removed = sum(self._conn.execute("DELETE FROM listings WHERE folder_id = ?", (folder_id,)).rowcount
+                              for folder_id in folder_ids)
+            self._bytes = self._total_bytes()
+        return removed
+
+    def summary(self):
+        return f"Cache danh sách thư mục: dùng lại {self.hits} thư mục, liệt kê mới {self.misses} thư mục."
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def invalidate_listing_cache(links=""):
+    """Xóa cache danh sách thư mục của các link (cách nhau bởi dấu phẩy/xuống dòng), hoặc toàn bộ nếu để trống."""
+    folder_ids = [extract_drive_id(link) for link in (links or "").replace("\n", ",").split(",") if link.strip()]
+    cache = ListingCache(0)
+    try:
+        removed = cache.invalidate([folder_id for folder_id in folder_ids if folder_id] if folder_ids else None)
+    finally:
+        cache.close()
+    return f"Đã xóa {removed} mục trong cache danh sách thư mục."
+
+
+class UploadSessions:
+    """Lưu URI và offset của các phiên tải lên resumable đang dở vào đĩa.
+
+    Mỗi phiên gắn với một file trên máy (đường dẫn, kích thước, mtime) và đích tải lên,
+    nên file đã bị sửa sau lần chạy trước sẽ được tải lại từ đầu.
+    """
+    def __init__(self, path=UPLOAD_SESSIONS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._sessions = json.load(f)
+        except (OSError, ValueError):
+            self._sessions = {}
+
+    @staticmethod
+    def key(file_path, target):
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{target}"
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def save(self, key, uri, offset):
+        with self._lock:
+            self._sessions[key] = {'uri': uri, 'offset': offset}
+            self._save_locked()
+
+    def remove(self, key):
+        with self._lock:
+            if self._sessions.pop(key, None) is not None:
+                self._save_locked()
+
+    def _save_locked(self):
+        # Ghi ra tệp tạm rồi đổi tên để không bao giờ để lại tệp phiên ghi dở
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._sessions, f)
+        os.replace(tmp_path, self.path)
+
+
+class CredentialCache:
+    """Credentials và service Drive dùng chung cho cả chương trình, mỗi vai trò (tải về/tải lên) một bộ.
+
+    Token pickle chỉ được đọc một lần; một luồng nền làm mới token trước khi hết hạn nên các lần bấm
+    nút sau không phải chờ OAuth. Service được build một lần cho mỗi luồng (httplib2 không an toàn
+    đa luồng) từ discovery document đi kèm thư viện, không tải qua mạng.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._creds = {}
+        self._thread_local = threading.local()
+        self._refresher = None
+
+    def get_credentials(self, role):
+        with self._lock:
+            creds = self._creds.get(role)
+            if creds is not None and creds.valid:
+                return creds
+
+            token_file, client_file = CREDENTIAL_ROLES[role]
+            if creds is None and os.path.exists(token_file):
+                with open(token_file, 'rb') as token:
+                    creds = pickle.load(token)
+
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(auth_requests.Request())
+                else:
+                    flow = oauth_flow.InstalledAppFlow.from_client_secrets_file(client_file, DRIVE_SCOPES)
+                    creds = flow.run_local_server(port=0)
+                self._save(role, creds)
+
+            self._creds[role] = creds
+            self._start_refresher()
+            return creds
+
+    def set_credentials(self, role, creds):
+        """Dùng credentials vừa xác thực thủ công cho vai trò `role` và lưu vào tệp token."""
+        with self._lock:
+            self._save(role, creds)
+            self._creds[role] = creds
+            self._start_refresher()
+
+    def service(self, role):
+        """Service Drive của luồng hiện tại cho vai trò `role`, build lại khi credentials đã bị thay."""
+        creds = self.get_credentials(role)
+        services = getattr(self._thread_local, 'services', None)
+        if services is None:
+            services = self._thread_local.services = {}
+        cached = services.get(role)
+        if cached is None or cached[0] is not creds:
+            cached = (creds, discovery.build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False))
+            services[role] = cached
+        return cached[1]
+
+    def clear(self):
+        """Quên mọi credentials đã nạp (khi xóa API key), lần sau sẽ đọc lại tệp token hoặc xác thực lại."""
+        with self._lock:
+            self._creds.clear()
+
+    @staticmethod
+    def _save(role, creds):
+        with open(CREDENTIAL_ROLES[role][0], 'wb') as token:
+            pickle.dump(creds, token)
+
+    def _start_refresher(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(TOKEN_CHECK_INTERVAL)
+            with self._lock:
+                roles = list(self._creds.items())
+            for role, creds in roles:
+                if not creds.refresh_token or creds.expiry is None:
+                    continue
+                # google-auth lưu expiry dạng UTC không kèm múi giờ
+                expires_in = (creds.expiry.replace(tzinfo=datetime.timezone.utc)
+                              - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                if expires_in > TOKEN_REFRESH_MARGIN:
+                    continue
+                try:
+                    with self._lock:
+                        if self._creds.get(role) is creds:
+                            creds.refresh(auth_requests.Request())
+                            self._save(role, creds)
+                except (auth_exceptions.GoogleAuthError, OSError) as e:
+                    print(f"Không làm mới được token {role}: {e}")
+
+
+credential_cache = CredentialCache()
+
+
 class UploadToDrive:
-    def __init__(self, client_id=None, client_secret=None):
-        """Khởi tạo và xác thực với Google Drive API, lưu token vào `upload_token.pickle`."""
+    def __init__(self, client_id=None, client_secret=None, events=None):
+        """Khởi tạo và xác thực với Google Drive API, lưu token vào `upload_token.pickle`.
+
+        `events(event, **fields)`, nếu có, nhận các sự kiện tiến độ của từng file.
+        """
         self.service = None
+        self._creds = None
+        self.events = events
+        self._sessions = UploadSessions()
         check_json_files()
 
         
@@ -213,31 +1895,14 @@ class UploadToDrive:
           
 
     def get_user_credential(self):
-        """Lấy token từ `upload_token.pickle` nếu tồn tại, hoặc xác thực lại."""
-        creds = None
-        if os.path.exists('upload_token.pickle'):
-            with open('upload_token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'ggupload.json', ['https://www.googleapis.com/auth/drive']
-                )
-                creds = flow.run_local_server(port=0)
-
-            # Lưu token vào upload_token.pickle
-            with open('upload_token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-
+        """Lấy credentials từ bộ nhớ đệm chung; lần đầu đọc `upload_token.pickle` hoặc xác thực lại."""
+        self._creds = credential_cache.get_credentials('upload')
         # Trả về dịch vụ Google Drive
-        return build('drive', 'v3', credentials=creds)
+        return credential_cache.service('upload')
 
     def authenticate_manually(self, client_id, client_secret):
         
-        flow = InstalledAppFlow.from_client_config(
+        flow = oauth_flow.InstalledAppFlow.from_client_config(
             {
                 "installed": {
                     "client_id": client_id,
@@ -253,42 +1918,41 @@ class UploadToDrive:
         creds = flow.run_local_server(port=0)
 
         # Lưu token mới vào upload_token.pickle
-        with open('upload_token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+        credential_cache.set_credentials('upload', creds)
+        self._creds = creds
+        self.service = credential_cache.service('upload')
 
-        self.service = build('drive', 'v3', credentials=creds)
-        
+    def _get_thread_service(self):
+        """Mỗi luồng dùng một service riêng vì `httplib2.Http` không an toàn đa luồng."""
+        return credential_cache.service('upload')
 
     def extract_folder_id_from_url(self, url):
         """Trích xuất ID thư mục từ URL và kiểm tra quyền truy cập."""
-        pattern = r'[-\w]{25,}'
-        match = re.search(pattern, url)
-        if match:
-            folder_id = match.group(0)
-            try:
-                # Kiểm tra quyền truy cập vào thư mục
-                self.service.files().get(fileId=folder_id, supportsAllDrives=True).execute()
-                return folder_id
-            except HttpError:
-                print(f"Lỗi: Không thể truy cập thư mục với ID {folder_id}. Kiểm tra quyền và URL.")
-                return None
-        else:
-            print("Lỗi: Định dạng URL không hợp lệ.")
-            return None
+        return self.check_folder_link(url)[0]
+
+    def check_folder_link(self, url):
+        """Kiểm tra link thư mục đích bằng `validate_folder_links`; trả về (ID hoặc None, thông báo)."""
+        (is_valid, message), = validate_folder_links(self.service, [url])
+        if not is_valid:
+            print(f"Lỗi: {message}")
+            return None, message
+        return extract_drive_id(url), message
+
+    def upload_file(self, file_path, parent_folder_id=None, service=None):
 
-    def upload_file(self, file_path, parent_folder_id=None):
-        
         file_name = os.path.basename(file_path)
         file_metadata = {'name': file_name}
         if parent_folder_id:
             file_metadata['parents'] = [parent_folder_id]
 
-        media = MediaFileUpload(file_path, resumable=True)
-        uploaded_file = self.service.files().create(
+        service = service or self.service
+        request = service.files().create(
             body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
+            media_body=self._media_for(file_path),
+            fields='id',
+            supportsAllDrives=True
+        )
+        uploaded_file = self._execute_upload(request, file_path, f"create:{parent_folder_id}")
         
         file_id = uploaded_file.get('id')
         link = f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
@@ -296,34 +1960,258 @@ class UploadToDrive:
         print(message)
         return message
 
-    def upload_folder(self, folder_path, parent_folder_id=None):
-        
+    def _emit(self, event, **fields):
+        if self.events is not None:
+            self.events(event, **fields)
+
+    def upload_files(self, file_paths, parent_folder_id=None, workers=DEFAULT_UPLOAD_WORKERS, progress=None):
+        """Tải nhiều file lẻ lên cùng một thư mục song song; trả về `TransferProgress`."""
+        progress = progress if progress is not None else TransferProgress()
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+            for file_path in file_paths:
+                pool.submit(self._upload_file_task, file_path, parent_folder_id, progress)
+        return progress
+
+    def update_file(self, file_path, file_id, service=None):
+        """Ghi đè nội dung một file đã có trên Drive, giữ nguyên ID và link chia sẻ."""
+        service = service or self.service
+        request = service.files().update(fileId=file_id, media_body=self._media_for(file_path), fields='id',
+                                         supportsAllDrives=True)
+        self._execute_upload(request, file_path, f"update:{file_id}")
+        print(f"File '{os.path.basename(file_path)}' đã được cập nhật!")
+
+    @staticmethod
+    def _media_for(file_path):
+        """File nhỏ gửi trong một request multipart (không tốn lượt mở phiên resumable),
+        file lớn dùng phiên resumable với chunk lớn."""
+        if os.path.getsize(file_path) < SMALL_UPLOAD_LIMIT:
+            return gapi_http.MediaFileUpload(file_path, resumable=False)
+        return gapi_http.MediaFileUpload(file_path, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+
+    def _execute_upload(self, request, file_path, target):
+        """Chạy request tải lên. Với phiên resumable, URI và offset được lưu sau mỗi chunk
+        nên lần chạy sau (kể cả sau khi tắt chương trình) tải tiếp thay vì tải lại từ đầu."""
+        if not request.resumable:
+            return drive_scheduler.execute(request)
+
+        key = self._sessions.key(file_path, target)
+        saved = self._sessions.get(key)
+        if saved is not None:
+            offset, response = self._query_upload_offset(saved['uri'], os.path.getsize(file_path))
+            if response is not None:
+                # Phiên trước đã tải hết nhưng chưa kịp ghi nhận
+                self._sessions.remove(key)
+                return response
+            if offset is not None:
+                request.resumable_uri = saved['uri']
+                request.resumable_progress = offset
+                print(f"Tiếp tục tải lên {os.path.basename(file_path)} từ byte {offset}")
+
+        response = None
+        while response is None:
+            _, response = drive_scheduler.next_chunk(request)
+            if response is None:
+                self._sessions.save(key, request.resumable_uri, request.resumable_progress)
+                self._emit('bytes_sent', path=file_path, sent=request.resumable_progress,
+                           size=os.path.getsize(file_path))
+        self._sessions.remove(key)
+        return response
+
+    def _query_upload_offset(self, session_uri, total_size):
+        """Hỏi Drive phiên resumable đã nhận bao nhiêu byte (PUT rỗng với `Content-Range: bytes */total`).
+
+        Trả về (offset, None) nếu phiên còn dở, (total_size, metadata) nếu đã xong,
+        (None, None) nếu phiên đã hết hạn và phải mở phiên mới.
+        """
+        session = auth_requests.AuthorizedSession(self._creds)
+        try:
+            response = session.put(session_uri, headers={'Content-Range': f'bytes */{total_size}',
+                                                         'Content-Length': '0'}, timeout=DOWNLOAD_TIMEOUT)
+        except requests.RequestException:
+            return None, None
+        finally:
+            session.close()
+
+        if response.status_code in (200, 201):
+            return total_size, response.json()
+        if response.status_code == 308:
+            # Header Range có dạng "bytes=0-<byte cuối đã nhận>", không có nghĩa là chưa nhận byte nào
+            received = response.headers.get('Range')
+            return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+        return None, None
+
+    def upload_folder(self, folder_path, parent_folder_id=None, workers=DEFAULT_UPLOAD_WORKERS, sync=False,
+                      async_engine=False, progress=None):
+        """Tải thư mục lên Drive.
+
+        Với `sync=True`, nếu thư mục đích đã có thư mục cùng tên thì chỉ tải file còn thiếu,
+        file đã thay đổi được cập nhật tại chỗ và file giống hệt (cùng MD5) được bỏ qua.
+        Với `async_engine=True` (cần aiohttp), file nhỏ được tải lên qua `AsyncDriveEngine`.
+        Truyền `progress` để cộng dồn tiến độ của nhiều lần gọi (dùng cho dòng lệnh).
+        """
         folder_name = os.path.basename(folder_path)
-        folder_id = self.create_folder(folder_name, parent_folder_id)
-        
-        # Duyệt qua cấu trúc thư mục và tải lên mà không trả về thông báo cho từng tệp
-        for root, _, files in os.walk(folder_path):
-            relative_path = os.path.relpath(root, folder_path)
-            current_folder_id = folder_id
+        progress = progress if progress is not None else TransferProgress()
+        workers = max(1, int(workers))
 
-            # Tạo các thư mục con trên Google Drive
-            if relative_path != '.':
-                current_folder_id = self.create_folder(relative_path, folder_id)
+        remote_folders, remote_files = {}, {}
+        folder_id = self._find_folder(folder_name, parent_folder_id) if sync else None
+        if folder_id is None:
+            folder_id = self.create_folder(folder_name, parent_folder_id)
+        else:
+            remote_folders, remote_files = self._list_destination(folder_id)
 
-            # Tải lên các tệp trong thư mục hiện tại mà không in thông báo từng tệp
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                self.upload_file(file_path, current_folder_id)
+        tree = list(os.walk(folder_path))
+        # Đường dẫn tương đối -> ID thư mục trên Drive, mỗi thư mục chỉ được tạo một lần
+        folder_ids = self._create_folder_tree(folder_id, [os.path.relpath(root, folder_path) for root, _, _ in tree],
+                                              remote_folders)
+        local_md5 = self._hash_changed_candidates(folder_path, tree, remote_files) if remote_files else {}
+
+        engine = self._open_engine(async_engine)
+        limit = workers * 4 + (engine.concurrency * 2 if engine is not None else 0)
+
+        # Duyệt qua cấu trúc thư mục và tải lên mà không trả về thông báo cho từng tệp
+        in_flight = set()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for root, _, files in tree:
+                    current_folder_id = folder_ids[os.path.relpath(root, folder_path)]
+
+                    # Tải lên các tệp trong thư mục hiện tại mà không in thông báo từng tệp
+                    for file_name in files:
+                        file_path = os.path.join(root, file_name)
+                        remote = remote_files.get(os.path.relpath(file_path, folder_path))
+                        if remote is not None and remote.get('md5Checksum') and local_md5.get(file_path) == remote['md5Checksum']:
+                            progress.add_skipped()
+                            continue
+                        if len(in_flight) >= limit:
+                            _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        if engine is not None and remote is None and os.path.getsize(file_path) < SMALL_UPLOAD_LIMIT:
+                            in_flight.add(engine.submit(self._upload_file_async(engine, file_path, current_folder_id,
+                                                                                progress)))
+                        else:
+                            in_flight.add(pool.submit(self._upload_file_task, file_path, current_folder_id, progress,
+                                                      remote['id'] if remote is not None else None))
+                wait(in_flight)
+        finally:
+            if engine is not None:
+                engine.close()
 
         # Trả về thông báo thành công cho thư mục chính
         folder_link = f"https://drive.google.com/drive/folders/{folder_id}?usp=sharing"
-        message = f"Thư mục '{folder_name}' đã được tải lên thành công!\nVui lòng xem kết quả tại đây: {folder_link}"
+        message = (f"Thư mục '{folder_name}' đã được tải lên thành công!\n{progress.summary()}\n"
+                   f"{drive_scheduler.summary()}\nVui lòng xem kết quả tại đây: {folder_link}")
         print(message)
         return message
 
+    def _find_folder(self, folder_name, parent_folder_id):
+        """ID của thư mục con tên `folder_name` trong thư mục cha, hoặc None nếu chưa có."""
+        escaped_name = folder_name.replace("\\", "\\\\").replace("'", "\\'")
+        query = (f"name = '{escaped_name}' and '{parent_folder_id or 'root'}' in parents"
+                 f" and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false")
+        response = drive_scheduler.execute(self.service.files().list(q=query, fields='files(id)', pageSize=1,
+                                                                supportsAllDrives=True,
+                                                                includeItemsFromAllDrives=True))
+        files = response.get('files', [])
+        return files[0]['id'] if files else None
+
+    def _list_destination(self, folder_id):
+        """Liệt kê cây thư mục đích một lần; trả về (đường dẫn tương đối -> ID thư mục,
+        đường dẫn tương đối -> metadata file)."""
+        remote_folders, remote_files = {}, {}
+
+        def on_folder(folder, parent_path):
+            path = os.path.normpath(os.path.join(parent_path, folder['name']))
+            remote_folders.setdefault(path, folder['id'])
+            return path
+
+        for parent_path, file in DriveWalker(self._get_thread_service).walk(folder_id, '.', on_folder):
+            remote_files.setdefault(os.path.normpath(os.path.join(parent_path, file['name'])), file)
+        return remote_folders, remote_files
+
+    def _hash_changed_candidates(self, folder_path, tree, remote_files):
+        """Băm MD5 các file trên máy có bản cùng tên và cùng kích thước trên Drive.
+
+        File khác kích thước chắc chắn đã thay đổi nên không cần đọc.
+        """
+        candidates = []
+        for root, _, files in tree:
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                remote = remote_files.get(os.path.relpath(file_path, folder_path))
+                if (remote is not None and remote.get('md5Checksum')
+                        and int(remote.get('size') or -1) == os.path.getsize(file_path)):
+                    candidates.append(file_path)
+
+        cache = HashCache()
+        try:
+            return cache.hash_files(candidates)
+        finally:
+            cache.close()
+
+    def _create_folder_tree(self, root_folder_id, relative_paths, existing_folders=None):
+        """Tạo các thư mục con theo từng cấp; mọi thư mục cùng cấp được tạo chung trong batch.
+
+        Thư mục đã có trong `existing_folders` (đường dẫn tương đối -> ID) không được tạo lại.
+        Trả về dict đường dẫn tương đối -> ID thư mục trên Drive.
+        """
+        folder_ids = dict(existing_folders or {})
+        folder_ids['.'] = root_folder_id
+        levels = {}
+        for relative_path in relative_paths:
+            if relative_path not in folder_ids:
+                levels.setdefault(relative_path.count(os.sep), []).append(relative_path)
+
+        for depth in sorted(levels):
+            paths = levels[depth]
+            requests_list = [self.service.files().create(
+                body={'name': os.path.basename(path), 'mimeType': FOLDER_MIME_TYPE,
+                      'parents': [folder_ids[os.path.dirname(path) or '.']]},
+                fields='id', supportsAllDrives=True) for path in paths]
+            for path, (folder, error) in zip(paths, DriveBatch(self.service).execute(requests_list)):
+                if error is not None:
+                    raise error
+                folder_ids[path] = folder['id']
+                print(f"Thư mục '{path}' đã được tạo với ID: {folder['id']}")
+        return folder_ids
+
+    def _open_engine(self, async_engine):
+        """Tạo `AsyncDriveEngine` nếu được yêu cầu và đã cài aiohttp, ngược lại trả về None."""
+        if not async_engine:
+            return None
+        if not HAS_AIOHTTP:
+            print("Chưa cài aiohttp (pip install aiohttp), dùng cách tải thông thường.")
+            return None
+        return AsyncDriveEngine(self._creds)
+
+    async def _upload_file_async(self, engine, file_path, parent_folder_id, progress):
+        self._emit('file_started', path=file_path, size=os.path.getsize(file_path))
+        try:
+            uploaded_file = await engine.upload(file_path, parent_folder_id)
+            print(f"File '{os.path.basename(file_path)}' đã được tải lên thành công!")
+            progress.add_done(os.path.getsize(file_path))
+            self._emit('file_finished', path=file_path, id=uploaded_file.get('id'), bytes=os.path.getsize(file_path))
+        except OSError as e:
+            print(f"An error occurred: {e}")
+            progress.add_failed(file_path)
+            self._emit('file_failed', path=file_path, error=str(e))
+
+    def _upload_file_task(self, file_path, parent_folder_id, progress, file_id=None):
+        self._emit('file_started', path=file_path, size=os.path.getsize(file_path))
+        try:
+            if file_id is not None:
+                self.update_file(file_path, file_id, service=self._get_thread_service())
+            else:
+                self.upload_file(file_path, parent_folder_id, service=self._get_thread_service())
+            progress.add_done(os.path.getsize(file_path))
+            self._emit('file_finished', path=file_path, bytes=os.path.getsize(file_path))
+        except (HttpError, OSError) as e:
+            print(f"An error occurred: {e}")
+            progress.add_failed(file_path)
+            self._emit('file_failed', path=file_path, error=str(e))
+
 
 
-    def create_folder(self, folder_name, parent_folder_id=None):
+    def create_folder(self, folder_name, parent_folder_id=None, service=None):
         """Tạo một thư mục trên Google Drive."""
         file_metadata = {
             'name': folder_name,
@@ -332,17 +2220,123 @@ class UploadToDrive:
         if parent_folder_id:
             file_metadata['parents'] = [parent_folder_id]
 
-        folder = self.service.files().create(body=file_metadata, fields='id').execute()
+        service = service or self.service
+        folder = drive_scheduler.execute(service.files().create(body=file_metadata, fields='id', supportsAllDrives=True))
         print(f"Thư mục '{folder_name}' đã được tạo với ID: {folder.get('id')}")
         return folder.get('id')
+
+    def clone_folder(self, source_url, parent_folder_id, workers=DEFAULT_DOWNLOAD_WORKERS, async_engine=False,
+                     filter_spec=None, progress=None):
+        """Sao chép file/thư mục chia sẻ vào thư mục đích ngay trên Google Drive.
+
+        Chỉ dùng `files().copy` và tạo thư mục, dữ liệu không đi qua máy tính nên không tốn băng thông.
+        Truyền `progress` để cộng dồn tiến độ của nhiều link (dùng cho dòng lệnh).
+        """
+        match = re.search(r'[-\w]{25,}', source_url)
+        if not match:
+            return f"link {source_url} ---> không phải link google drive, vui lòng kiểm tra lại!"
+        source = drive_scheduler.execute(self.service.files().get(fileId=match.group(0), fields=FILE_FIELDS,
+                                                                  supportsAllDrives=True))
+        progress = progress if progress is not None else TransferProgress()
+
+        if source['mimeType'] != FOLDER_MIME_TYPE:
+            self._copy_drive_file(source, parent_folder_id, progress)
+            return progress.summary()
+
+        root_id = self.create_folder(source['name'], parent_folder_id)
+        walker = DriveWalker(self._get_thread_service, filter_spec, follow_shortcuts=True)
+
+        def on_folder(folder, dest_parent_id):
+            # Chạy trong luồng liệt kê: tạo thư mục tương ứng bên đích trước khi sao chép file bên trong
+            return self.create_folder(folder['name'], dest_parent_id, service=self._get_thread_service())
+
+        engine = self._open_engine(async_engine)
+        limit = workers * 4 + (engine.concurrency * 2 if engine is not None else 0)
+        in_flight = set()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+                for dest_parent_id, file in walker.walk(source['id'], root_id, on_folder):
+                    if len(in_flight) >= limit:
+                        _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    if engine is not None:
+                        # Sao chép chỉ là một yêu cầu metadata, nên mọi file đều đi qua engine asyncio
+                        in_flight.add(engine.submit(self._copy_drive_file_async(engine, file, dest_parent_id,
+                                                                                progress)))
+                    else:
+                        in_flight.add(pool.submit(self._copy_drive_file, file, dest_parent_id, progress))
+                wait(in_flight)
+        finally:
+            if engine is not None:
+                engine.close()
+
+        folder_link = f"https://drive.google.com/drive/folders/{root_id}?usp=sharing"
+        return (f"Thư mục '{source['name']}' đã được sao chép vào Drive của bạn!\n"
+                f"{progress.summary()}\n{drive_scheduler.summary()}\nVui lòng xem kết quả tại đây: {folder_link}")
+
+    def _copy_drive_file(self, source_file, dest_parent_id, progress):
+        try:
+            drive_scheduler.execute(self._get_thread_service().files().copy(
+                fileId=source_file['id'], body={'name': source_file['name'], 'parents': [dest_parent_id]},
+                fields='id', supportsAllDrives=True))
+            print(f"Đã sao chép {source_file['name']}")
+            progress.add_done(int(source_file.get('size') or 0))
+            self._emit('file_finished', id=source_file['id'], name=source_file['name'],
+                       bytes=int(source_file.get('size') or 0))
+        except HttpError as e:
+            print(f"An error occurred: {e}")
+            progress.add_failed(source_file['name'])
+            self._emit('file_failed', id=source_file['id'], name=source_file['name'], error=str(e))
+
+    async def _copy_drive_file_async(self, engine, source_file, dest_parent_id, progress):
+        try:
+            await engine.copy(source_file['id'], source_file['name'], dest_parent_id)
+            print(f"Đã sao chép {source_file['name']}")
+            progress.add_done(int(source_file.get('size') or 0))
+            self._emit('file_finished', id=source_file['id'], name=source_file['name'],
+                       bytes=int(source_file.get('size') or 0))
+        except OSError as e:
+            print(f"An error occurred: {e}")
+            progress.add_failed(source_file['name'])
+            self._emit('file_failed', id=source_file['id'], name=source_file['name'], error=str(e))
     
 class DownloadFromDrive:
-    def __init__(self, client_id=None, client_secret=None):
+    def __init__(self, client_id=None, client_secret=None, workers=1,
+                 segments=DEFAULT_SEGMENT_COUNT, segment_threshold_mb=DEFAULT_SEGMENT_THRESHOLD_MB,
+                 sync_changes=False, plan_order=PLAN_ORDER_LISTING, async_engine=False, events=None,
+                 filter_spec=None, listing_ttl_min=DEFAULT_LISTING_TTL_MIN, control=None, verify_segmented=True):
         check_json_files()
-        self._total_size = 0
-        self._limit_size = 0
-        self.excluded_strings = [ext.strip() for ext in exclude_str.split(",") if ext.strip()]
+        self.events = events  # events(event, **fields) nhận sự kiện tiến độ, nếu có
+        self.control = control  # JobControl: tạm dừng/hủy job giữa chừng, nếu có
+        self._limit_size = 0  # Ngân sách dung lượng (GB) cho cả job, 0 là không giới hạn
+        self._plan_order = plan_order
+        self._planned = None
+        self._deferred_checkpoints = []
+        self._budget = None  # TransferPlan xét từng file khi tải theo thứ tự liệt kê có giới hạn dung lượng
+        self._filter = filter_spec or FilterSpec()
+        self._listing_ttl = float(listing_ttl_min or 0) * 60
+        self._listing_cache = None
         self.service = None
+        self._creds = None
+        self._workers = max(1, int(workers))
+        self._segments = max(1, int(segments))
+        self._segment_threshold = int(float(segment_threshold_mb) * 1024 * 1024)
+        # Kiểm tra MD5 file tải nhiều đoạn: phần không băm được khi đang tải phải đọc lại từ đĩa
+        self._verify_segmented = verify_segmented
+        self._hash_lock = threading.Lock()
+        self._rehashed_bytes = 0
+        self._unverified_files = 0
+        self._sync_changes = sync_changes
+        self._async_engine = async_engine
+        self._executor = None
+        self._engine = None
+        self._writer = None
+        self._dedup = None
+        self._index = None
+        self._inflight = 0
+        self._inflight_errors = 0
+        self._inflight_cond = threading.Condition()
+        self.progress = TransferProgress()
+        self.links_failed = 0  # Link không tải được (không hợp lệ, không có quyền, lỗi khi liệt kê)
         
         if client_id and client_secret:
             self.authenticate_manually(client_id, client_secret)
@@ -353,31 +2347,14 @@ class DownloadFromDrive:
         
 
     def get_user_credential(self):
-        """Lấy token từ `download_token.pickle` nếu tồn tại, hoặc xác thực lại."""
-        creds = None
-        if os.path.exists('download_token.pickle'):
-            with open('download_token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'ggdownload.json', ['https://www.googleapis.com/auth/drive']
-                )
-                creds = flow.run_local_server(port=0)
-
-            # Lưu token vào upload_token.pickle
-            with open('download_token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-
+        """Lấy credentials từ bộ nhớ đệm chung; lần đầu đọc `download_token.pickle` hoặc xác thực lại."""
+        self._creds = credential_cache.get_credentials('download')
         # Trả về dịch vụ Google Drive
-        return build('drive', 'v3', credentials=creds)
+        return credential_cache.service('download')
 
     def authenticate_manually(self, client_id, client_secret):
         
-        flow = InstalledAppFlow.from_client_config(
+        flow = oauth_flow.InstalledAppFlow.from_client_config(
             {
                 "installed": {
                     "client_id": client_id,
@@ -392,74 +2369,526 @@ class DownloadFromDrive:
 
         creds = flow.run_local_server(port=0)
 
-        # Lưu token mới vào upload_token.pickle
-        with open('download_token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-        self.service = build('drive', 'v3', credentials=creds)
-        
-
-    
-     
-    def get_childs_from_folder(self, drive_service, folder_id, dest_folder):
-        query = f"'{folder_id}' in parents and trashed = false"
-        if self.excluded_strings:
-            query += " and " + " and ".join([f"not name contains '{ext}'" for ext in self.excluded_strings])
-
-        page_token = None
-        while True:
-            response = drive_service.files().list(q=query, orderBy='name, createdTime',
-                                                fields='files(id, name, mimeType, size), nextPageToken',
-                                                pageToken=page_token, supportsAllDrives=True,
-                                                includeItemsFromAllDrives=True).execute()
-            for file in response.get('files', []):
-                # Kiểm tra nếu file là thư mục, thì tạo thư mục tương ứng và đệ quy vào bên trong
-                if file['mimeType'] == 'application/vnd.google-apps.folder':
-                    # Tạo thư mục con tương ứng
-                    subfolder_path = os.path.join(dest_folder, file['name'])
-                    os.makedirs(subfolder_path, exist_ok=True)
-                    # Đệ quy để tải các file bên trong thư mục con
-                    self.get_childs_from_folder(drive_service, file['id'], subfolder_path)
-                else:
-                    # Tải file vào thư mục hiện tại
-                    self.copy_file(drive_service, dest_folder, file)
-
-            page_token = response.get('nextPageToken', None)
-            if page_token is None:
-                break
-
-
+        # Lưu token mới vào download_token.pickle
+        credential_cache.set_credentials('download', creds)
+        self._creds = creds
+        self.service = credential_cache.service('download')
+
+    def _get_thread_service(self):
+        """Mỗi luồng tải dùng một service riêng vì `httplib2.Http` không an toàn đa luồng."""
+        return credential_cache.service('download')
+
+    def _submit_copy(self, drive_service, dest_folder, source_file):
+        """Tải ngay nếu chạy 1 luồng, ngược lại đẩy file vào pool các luồng tải.
+
+        Số file đang chờ trong pool bị giới hạn để bộ nhớ không tăng theo kích thước cây thư mục.
+        """
+        self._check_control()
+        if source_file['mimeType'].startswith(GOOGLE_APPS_MIME_PREFIX):
+            # get_media luôn lỗi với file Google (Docs, Sheets...): bỏ qua thay vì tính là lỗi,
+            # để một file như vậy trong cây không chặn việc lưu checkpoint đồng bộ
+            print(f"{source_file['name']} là file Google ({source_file['mimeType']}), không tải được trực tiếp. Bỏ qua.")
+            self.progress.add_skipped()
+            self._emit('file_skipped', id=source_file['id'], path=os.path.join(dest_folder, source_file['name']),
+                       reason='google_native')
+            return
+        if self._planned is not None:
+            # Đang lập kế hoạch: chỉ ghi nhận file, chưa tải
+            self._planned.append((self._transfer_cost(dest_folder, source_file), dest_folder, source_file))
+            return
+        if self._budget is not None:
+            cost = self._transfer_cost(dest_folder, source_file)
+            if not self._budget.admit((cost, dest_folder, source_file)):
+                print(f"{source_file['name']} ({cost / (1024 * 1024):0.2f} MB) vượt giới hạn dung lượng. Bỏ qua.")
+                self._emit('file_skipped', id=source_file['id'], path=os.path.join(dest_folder, source_file['name']),
+                           reason='budget', bytes=cost)
+                return
+        if self._engine is not None and int(source_file.get('size', ASYNC_FILE_LIMIT)) < ASYNC_FILE_LIMIT:
+            # File nhỏ: tải trong engine asyncio, không chiếm luồng tải
+            self._reserve_slot()
+            future = self._engine.submit(self._copy_file_async(dest_folder, source_file))
+            future.add_done_callback(self._on_copy_done)
+            return
+        if self._executor is None:
+            self.copy_file(drive_service, dest_folder, source_file)
+            return
+        self._reserve_slot()
+        future = self._executor.submit(self._copy_file_worker, dest_folder, source_file)
+        future.add_done_callback(self._on_copy_done)
+
+    def _emit(self, event, **fields):
+        if self.events is not None:
+            self.events(event, **fields)
+
+    def _check_control(self):
+        # File `.part` và tệp trạng thái được giữ lại, nên job chạy lại sẽ tải tiếp từ chỗ dừng
+        if self.control is not None:
+            self.control.check()
+
+    def _reserve_slot(self):
+        limit = self._workers * 4 + (self._engine.concurrency * 2 if self._engine is not None else 0)
+        with self._inflight_cond:
+            while self._inflight >= limit:
+                self._inflight_cond.wait()
+            self._inflight += 1
+
+    def _copy_file_worker(self, dest_folder, source_file):
+        self._check_control()
+        self.copy_file(self._get_thread_service(), dest_folder, source_file)
+
+    def _on_copy_done(self, future):
+        error = future.exception()
+        if isinstance(error, JobInterrupted):
+            # Tạm dừng/hủy không phải lỗi của tệp: job tự báo trạng thái mới
+            error = None
+        if error is not None:
+            print(f"An error occurred: {error}")
+        with self._inflight_cond:
+            self._inflight -= 1
+            if error is not None:
+                self._inflight_errors += 1
+            self._inflight_cond.notify_all()
+
+    def _wait_pending(self):
+        """Chờ các file đã đẩy vào pool tải xong, trả về số file bị lỗi ngoài dự kiến."""
+        with self._inflight_cond:
+            while self._inflight:
+                self._inflight_cond.wait()
+            failed, self._inflight_errors = self._inflight_errors, 0
+        return failed
+
+    def _make_local_folder(self, folder, parent_path):
+        """Tạo thư mục con tương ứng trên máy, trả về đường dẫn để gắn cho các file bên trong."""
+        subfolder_path = os.path.join(parent_path, folder['name'])
+        os.makedirs(subfolder_path, exist_ok=True)
+        if self._index is not None:
+            self._index.record_folder(folder['id'], subfolder_path)
+        return subfolder_path
+
+    @staticmethod
+    def _drive_kwargs(drive_id):
+        # Thư mục nằm trong Shared Drive cần driveId để đọc đúng luồng thay đổi của drive đó
+        return {'driveId': drive_id} if drive_id else {}
+
+    def _apply_changes(self, service, checkpoint):
+        """Đọc `changes.list` từ checkpoint và áp dụng các thay đổi nằm trong cây đã đồng bộ.
+
+        Trả về page token mới để lưu làm checkpoint cho lần sau.
+        """
+        page_token = checkpoint['page_token']
+        new_page_token = None
+        applied = 0
+        while page_token is not None:
+            response = drive_scheduler.execute(service.changes().list(
+                pageToken=page_token, pageSize=LIST_PAGE_SIZE, fields=CHANGE_FIELDS, includeRemoved=True,
+                supportsAllDrives=True, includeItemsFromAllDrives=True,
+                **self._drive_kwargs(checkpoint['drive_id'])))
+            for change in response.get('changes', []):
+                if change.get('changeType', 'file') == 'file' and self._apply_change(service, change):
+                    applied += 1
+            new_page_token = response.get('newStartPageToken', new_page_token)
+            page_token = response.get('nextPageToken')
+        print(f"Đã áp dụng {applied} thay đổi từ Google Drive.")
+        return new_page_token
+
+    def _apply_change(self, service, change):
+        """Áp dụng một thay đổi; trả về True nếu nó thuộc cây đã đồng bộ."""
+        file_id = change['fileId']
+        file = change.get('file')
+        if self._listing_cache is not None:
+            # Danh sách đã lưu của thư mục chứa mục này (và của chính nó nếu là thư mục) không còn đúng
+            self._listing_cache.invalidate([file_id] + (file.get('parents', []) if file is not None else []))
+        if self._index.is_root(file_id):
+            if change.get('removed') or file is None or file.get('trashed'):
+                return self._remove_local(file_id)
+            # Đổi tên, gắn sao, chia sẻ... trên chính mục gốc: cha của nó không thuộc cây đã đồng bộ
+            # nên không được đi tiếp xuống nhánh xóa bên dưới
+            return self._rename_root(file)
+        parent_path = None
+        if file is not None and file['mimeType'] == SHORTCUT_MIME_TYPE and not change.get('removed') \
+                and not file.get('trashed'):
+            # Lối tắt được tải như file/thư mục đích, nằm ở vị trí của lối tắt
+            target = resolve_shortcuts(service, [file])[0]
+            file = dict(target, parents=file.get('parents', [])) if target is not None else None
+        # Mục không còn khớp bộ lọc (ví dụ vừa đổi tên) được coi như đã ra khỏi cây đã đồng bộ
+        if (file is not None and not change.get('removed') and not file.get('trashed')
+                and self._filter.matches(file)):
+            for parent_id in file.get('parents', []):
+                parent_path = self._index.get_folder_path(parent_id)
+                if parent_path is not None:
+                    break
+
+        if parent_path is None:
+            # Bị xóa, vào thùng rác, chuyển ra khỏi cây đã đồng bộ hoặc bị bộ lọc loại
+            return self._remove_local(file_id)
+
+        new_path = os.path.join(parent_path, file['name'])
+        if file['mimeType'] != FOLDER_MIME_TYPE:
+            self._submit_copy(service, parent_path, file)
+            return True
+
+        old_path = self._index.get_folder_path(file_id)
+        if old_path is None:
+            # Thư mục mới (hoặc vừa chuyển vào cây): tải toàn bộ nội dung bên trong
+            self._make_local_folder(file, parent_path)
+            self.get_childs_from_folder(service, file_id, new_path, file.get('modifiedTime'))
+        elif old_path != new_path:
+            self._move_local_folder(old_path, new_path)
+        return True
+
+    def _move_local_folder(self, old_path, new_path):
+        # Đổi tên/di chuyển thư mục: các file đang tải trong đó phải xong trước khi di chuyển
+        self._wait_pending()
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(old_path, new_path)
+        self._index.move_tree(old_path, new_path)
+        print(f"Đã di chuyển thư mục {old_path} -> {new_path}")
+
+    def _rename_root(self, file):
+        """Đổi tên bản trên máy của thư mục gốc nếu nó được đổi tên trên Drive; thay đổi khác được bỏ qua."""
+        old_path = self._index.get_folder_path(file['id'])
+        if old_path is None or file['mimeType'] != FOLDER_MIME_TYPE:
+            return False
+        new_path = os.path.join(os.path.dirname(old_path), file['name'])
+        if new_path == old_path or os.path.exists(new_path) or not os.path.isdir(old_path):
+            return False
+        self._move_local_folder(old_path, new_path)
+        return True
+
+    def _remove_local(self, item_id):
+        """Xóa bản trên máy của file/thư mục không còn trong cây đã đồng bộ; trả về True nếu có xóa."""
+        entries = self._index.get_all(item_id)
+        if entries:
+            self._wait_pending()
+            for entry in entries:
+                path = self._index.abspath(entry['path'])
+                if os.path.exists(path):
+                    os.remove(path)
+                print(f"Đã xóa {path} (không còn trên Google Drive)")
+            self._index.forget(item_id)
+            return True
+
+        folder_path = self._index.get_folder_path(item_id)
+        if folder_path is None:
+            return False
+        self._wait_pending()
+        for path in self._index.remove_tree(folder_path):
+            if os.path.exists(path):
+                os.remove(path)
+        # Chỉ xóa các thư mục đã trống, không đụng tới file người dùng tự thêm vào
+        for root, _, _ in sorted(os.walk(folder_path), key=lambda item: len(item[0]), reverse=True):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+        print(f"Đã xóa thư mục {folder_path} (không còn trên Google Drive)")
+        return True
+
+    def get_childs_from_folder(self, drive_service, folder_id, dest_folder, modified_time=None):
+        # Việc liệt kê chạy ở luồng nền (service riêng), file được tải ngay khi vừa liệt kê xong
+        walker = DriveWalker(self._get_thread_service, self._filter, cache=self._listing_cache, follow_shortcuts=True)
+        for folder_path, file in walker.walk(folder_id, dest_folder, self._make_local_folder, modified_time):
+            self._submit_copy(drive_service, folder_path, file)
 
     def copy_file(self, drive_service, dest_folder, source_file):
-        if source_file['mimeType'] != 'application/vnd.google-apps.folder':
+        if source_file['mimeType'] != FOLDER_MIME_TYPE:
             file_name = source_file['name']
             download_path = os.path.join(dest_folder, file_name)
-            
-            if not os.path.exists(download_path):
+            entry = self._index.get(source_file['id'], download_path) if self._index is not None else None
+
+            # Sổ đăng ký được xét trước chỉ mục: ID gặp lại trong cùng job (link chồng nhau, lối tắt)
+            # phải liên kết tới bản đã có, không được di chuyển bản đó sang chỗ mới
+            duplicate = self._dedup.claim(source_file) if self._dedup is not None else None
+            if duplicate is not None:
+                self._link_duplicate(source_file, duplicate, download_path, entry)
+            # File chỉ xuất hiện ở đường dẫn cuối cùng khi đã tải xong (được đổi tên từ `.part`)
+            elif self._reuse_local_copy(source_file, download_path, entry):
+                if self._dedup is not None:
+                    self._dedup.release(source_file, download_path)
+                self.progress.add_skipped()
+                self._emit('file_skipped', id=source_file['id'], path=download_path)
+            else:
+                self._emit_started(source_file, download_path)
                 try:
-                    request = drive_service.files().get_media(fileId=source_file['id'])
-                    with open(download_path, 'wb') as f:
-                        downloader = MediaIoBaseDownload(f, request)
-                        done = False
-                        self._total_size = 0  
-                        start_time = time.time()  
-
-                        while not done:
-                            status, done = downloader.next_chunk()
-                            self._total_size += status.resumable_progress  
-                            print(f"Tải {file_name}: {int(status.progress() * 100)}%")
-                        
-                        end_time = time.time()  
-                        
-                        # Tính toán tốc độ tải
-                        size_mb = self._total_size / (1024 * 1024)  # Kích thước tính theo MB
-                        speed_mb = size_mb / (end_time - start_time)  # Tốc độ tính theo MB/s
-                        print(f"Xong {file_name}. Kích thước {size_mb:0.2f} MB. Thời gian {int(end_time - start_time)} giây. Tốc độ {speed_mb:0.2f} MB/s")
-
-                except HttpError as e:
+                    start_time = time.time()
+                    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                        try:
+                            downloaded_size = self._download_file(drive_service, source_file, download_path)
+                            break
+                        except ChecksumMismatch as e:
+                            if attempt == DOWNLOAD_ATTEMPTS:
+                                raise
+                            print(f"{e}. Tải lại lần {attempt + 1}/{DOWNLOAD_ATTEMPTS}...")
+                    end_time = time.time()
+                    self._finish_copy(source_file, download_path, entry, downloaded_size, end_time - start_time)
+
+                except (HttpError, requests.RequestException, OSError) as e:
                     print(f"An error occurred: {e}")
-            else:
-                print(f"{file_name} đã tồn tại trong {dest_folder}. Bỏ qua.")
+                    self.progress.add_failed(file_name)
+                    self._emit('file_failed', id=source_file['id'], path=download_path, error=str(e))
+                finally:
+                    # Tải thành công thì đã ghi nhận trong _finish_copy, ở đây chỉ giải phóng các luồng đang chờ
+                    if self._dedup is not None:
+                        self._dedup.release(source_file, None)
+
+    def _link_duplicate(self, source_file, existing_path, download_path, entry):
+        """Tạo bản trên máy của file trùng nội dung với bản đã tải trong job, không tải lại."""
+        same_path = os.path.normcase(os.path.abspath(existing_path)) == os.path.normcase(os.path.abspath(download_path))
+        up_to_date = (entry is not None and self._index.abspath(entry['path']) == download_path
+                      and SyncIndex.is_unchanged(entry, source_file) and os.path.exists(download_path))
+        if same_path or up_to_date:
+            # Cùng file gặp lại ở đúng đường dẫn đó, hoặc bản ở đây đã có từ lần chạy trước
+            print(f"{source_file['name']} không thay đổi. Bỏ qua.")
+            self.progress.add_skipped()
+            self._emit('file_skipped', id=source_file['id'], path=download_path)
+            return
+        try:
+            os.makedirs(os.path.dirname(download_path), exist_ok=True)
+            linked = link_or_copy(existing_path, download_path)
+            if self._index is not None:
+                self._index.record(source_file, download_path)
+                # Bản ghi ở đường dẫn khác có thể chính là bản nguồn vừa liên kết tới: không xóa
+                if entry is not None and self._index.abspath(entry['path']) not in (existing_path, download_path):
+                    self._index.discard_stale_copy(entry, source_file['id'], download_path)
+            size = os.path.getsize(download_path)
+            print(f"{source_file['name']} trùng nội dung với {existing_path}: đã "
+                  f"{'tạo hardlink' if linked else 'chép từ bản trên máy'}, không cần tải lại.")
+            self.progress.add_linked(size)
+            self._emit('file_linked', id=source_file['id'], path=download_path, source=existing_path, bytes=size)
+        except OSError as e:
+            print(f"An error occurred: {e}")
+            self.progress.add_failed(source_file['name'])
+            self._emit('file_failed', id=source_file['id'], path=download_path, error=str(e))
+
+    async def _copy_file_async(self, dest_folder, source_file):
+        """Bản asyncio của `copy_file` cho file nhỏ, chạy trong `AsyncDriveEngine`."""
+        self._check_control()
+        file_name = source_file['name']
+        download_path = os.path.join(dest_folder, file_name)
+        entry = self._index.get(source_file['id'], download_path) if self._index is not None else None
+        # Như copy_file: xét sổ đăng ký trước chỉ mục. Không chờ bản đang tải ở luồng khác
+        # để khỏi chặn vòng lặp sự kiện
+        duplicate = self._dedup.find(source_file) if self._dedup is not None else None
+        if duplicate is not None:
+            self._link_duplicate(source_file, duplicate, download_path, entry)
+            return
+        if self._reuse_local_copy(source_file, download_path, entry):
+            if self._dedup is not None:
+                self._dedup.release(source_file, download_path)
+            self.progress.add_skipped()
+            self._emit('file_skipped', id=source_file['id'], path=download_path)
+            return
+
+        self._emit_started(source_file, download_path)
+        part_path = download_path + PART_SUFFIX
+        try:
+            start_time = time.time()
+            for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                downloaded_size, digest = await self._engine.download(source_file['id'], part_path)
+                expected = source_file.get('md5Checksum')
+                if not expected or digest == expected:
+                    break
+                os.remove(part_path)
+                message = f"{file_name}: MD5 {digest} không khớp với Drive ({expected})"
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise ChecksumMismatch(message)
+                print(f"{message}. Tải lại lần {attempt + 1}/{DOWNLOAD_ATTEMPTS}...")
+            os.replace(part_path, download_path)
+            # Tệp trạng thái còn sót lại từ một lần tải theo đoạn trước đó
+            if os.path.exists(part_path + STATE_SUFFIX):
+                os.remove(part_path + STATE_SUFFIX)
+            self._finish_copy(source_file, download_path, entry, downloaded_size, time.time() - start_time)
+        except OSError as e:
+            print(f"An error occurred: {e}")
+            self.progress.add_failed(file_name)
+            self._emit('file_failed', id=source_file['id'], path=download_path, error=str(e))
+
+    def _emit_started(self, source_file, download_path):
+        self._emit('file_started', id=source_file['id'], path=download_path,
+                   size=int(source_file['size']) if 'size' in source_file else None)
+
+    def _finish_copy(self, source_file, download_path, entry, downloaded_size, elapsed):
+        # Tính toán tốc độ tải
+        size_mb = downloaded_size / (1024 * 1024)  # Kích thước tính theo MB
+        speed_mb = size_mb / max(elapsed, 0.001)  # Tốc độ tính theo MB/s
+        print(f"Xong {source_file['name']}. Kích thước {size_mb:0.2f} MB. Thời gian {int(elapsed)} giây. Tốc độ {speed_mb:0.2f} MB/s")
+        if self._index is not None:
+            self._index.record(source_file, download_path)
+            if entry is not None:
+                self._index.discard_stale_copy(entry, source_file['id'], download_path)
+        if self._dedup is not None:
+            self._dedup.release(source_file, download_path)
+        self.progress.add_done(downloaded_size)
+        self._emit('file_finished', id=source_file['id'], path=download_path, bytes=downloaded_size,
+                   seconds=round(elapsed, 3))
+
+    def _reuse_local_copy(self, source_file, download_path, entry):
+        """Trả về True nếu trên máy đã có bản sao không đổi của file (di chuyển/đổi tên nếu cần)."""
+        file_name = source_file['name']
+        if entry is None:
+            if os.path.exists(download_path):
+                # File có từ trước khi có chỉ mục: vẫn bỏ qua như trước, ghi nhận nếu kích thước khớp
+                if self._index is not None and str(os.path.getsize(download_path)) == source_file.get('size'):
+                    self._index.record(source_file, download_path)
+                print(f"{file_name} đã tồn tại trong {os.path.dirname(download_path)}. Bỏ qua.")
+                return True
+            return False
+
+        old_path = self._index.abspath(entry['path'])
+        if not SyncIndex.is_unchanged(entry, source_file) or not os.path.exists(old_path):
+            # File đã đổi trên Drive: tải lại, bản mới sẽ thay thế bản cũ khi tải xong
+            return False
+        if os.path.normcase(os.path.abspath(old_path)) == os.path.normcase(os.path.abspath(download_path)):
+            print(f"{file_name} không thay đổi. Bỏ qua.")
+            return True
+        if os.path.exists(download_path):
+            return False
+
+        # File được đổi tên hoặc di chuyển trên Drive: di chuyển bản trên máy thay vì tải lại
+        os.makedirs(os.path.dirname(download_path), exist_ok=True)
+        os.replace(old_path, download_path)
+        self._index.record(source_file, download_path)
+        self._index.forget(source_file['id'], entry['path'])
+        print(f"Đã di chuyển {old_path} -> {download_path} (không cần tải lại)")
+        return True
+
+    def _download_file(self, drive_service, source_file, download_path):
+        if 'size' in source_file:
+            file_size = int(source_file['size'])
+            segments = self._segments if file_size >= self._segment_threshold else 1
+            return self._download_ranges(source_file, download_path, segments)
+        return self._download_stream(drive_service, source_file, download_path)
+
+    def _download_stream(self, drive_service, source_file, download_path):
+        """Tải cả file qua `MediaIoBaseDownload`, dùng cho file Drive không báo `size` (không tải tiếp được)."""
+        file_name = source_file['name']
+        part_path = download_path + PART_SUFFIX
+        request = drive_service.files().get_media(fileId=source_file['id'])
+        # MediaIoBaseDownload chỉ gọi f.write(): ghi đĩa chạy trên luồng ghi trong lúc tải chunk tiếp theo
+        with self._writer.open(part_path, mode='wb') as f:
+            downloader = gapi_http.MediaIoBaseDownload(f, request)
+            done = False
+            # Biến cục bộ: nhiều luồng có thể cùng tải các file khác nhau
+            downloaded_size = 0
+            while not done:
+                self._check_control()
+                status, done = drive_scheduler.next_chunk(downloader)
+                downloaded_size = status.resumable_progress
+                self._emit('bytes_received', id=source_file['id'], received=downloaded_size, size=status.total_size)
+                print(f"Tải {file_name}: {int(status.progress() * 100)}%")
+        os.replace(part_path, download_path)
+        return downloaded_size
+
+    def _download_ranges(self, source_file, download_path, segment_count):
+        """Tải file vào `<tên>.part` bằng một hoặc nhiều yêu cầu HTTP Range song song rồi đổi tên khi xong.
+
+        Số byte đã nhận của từng đoạn được ghi vào tệp trạng thái đi kèm, nên lần chạy sau tiếp tục
+        từ đúng offset thay vì tải lại từ đầu. Nếu kích thước hoặc MD5 cuối cùng không khớp với Drive
+        thì file dở dang bị xóa để tải lại.
+        Trả về số byte thực sự tải trong lần chạy này.
+        """
+        file_name = source_file['name']
+        total_size = int(source_file['size'])
+        part_path = download_path + PART_SUFFIX
+        state_path = part_path + STATE_SUFFIX
+
+        state = PartState.load(state_path, source_file['id'], total_size)
+        if state is None or not os.path.exists(part_path):
+            segment_size = max(1, -(-total_size // segment_count))  # Làm tròn lên
+            ranges = [[start, min(start + segment_size, total_size) - 1, 0]
+                      for start in range(0, total_size, segment_size)]
+            state = PartState(state_path, source_file['id'], total_size, ranges)
+            # Cấp phát trước đủ kích thước để mỗi đoạn ghi vào đúng offset của nó
+            with open(part_path, 'wb') as f:
+                f.truncate(total_size)
+            state.save()
+        else:
+            print(f"Tiếp tục tải {file_name} từ byte {state.received()}/{total_size}")
+        resumed_from = state.received()
+
+        # Băm MD5 ngay trong lúc nhận dữ liệu: tải một đoạn thì không phải đọc lại file sau khi tải,
+        # tải nhiều đoạn thì chỉ đọc lại phần nằm sau đoạn đầu. Khi tải tiếp, phần đã có của đoạn
+        # đầu được đọc lại một lần.
+        hasher = None
+        verify = source_file.get('md5Checksum') and (len(state.segments) == 1 or self._verify_segmented)
+        if verify:
+            prefix = state.segments[0][2]
+            hasher = PrefixHasher(hash_file(part_path, prefix), prefix)
+
+        pending = [index for index, (start, end, received) in enumerate(state.segments) if start + received <= end]
+        if len(pending) == 1:
+            self._download_range(source_file['id'], part_path, state, pending[0], hasher)
+        elif pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as segment_pool:
+                futures = [segment_pool.submit(self._download_range, source_file['id'], part_path, state, index, hasher)
+                           for index in pending]
+                for done_count, future in enumerate(futures, 1):
+                    future.result()
+                    print(f"Tải {file_name}: xong đoạn {done_count}/{len(pending)}")
+
+        if state.received() != total_size or os.path.getsize(part_path) != total_size:
+            os.remove(part_path)
+            state.remove()
+            raise IOError(f"{file_name}: kích thước tải về {state.received()} byte không khớp với Drive ({total_size} byte)")
+        if hasher is None and source_file.get('md5Checksum'):
+            # Đã tắt kiểm tra MD5 cho file tải nhiều đoạn: chỉ kiểm tra kích thước
+            with self._hash_lock:
+                self._unverified_files += 1
+        if hasher is not None:
+            digest, reread = hasher.finish(part_path, total_size)
+            with self._hash_lock:
+                self._rehashed_bytes += reread
+            if digest != source_file['md5Checksum']:
+                os.remove(part_path)
+                state.remove()
+                raise ChecksumMismatch(f"{file_name}: MD5 {digest} không khớp với Drive ({source_file['md5Checksum']})")
+        os.replace(part_path, download_path)
+        state.remove()
+        return total_size - resumed_from
+
+    def _download_range(self, file_id, part_path, state, index, hasher=None):
+        """Tải phần còn thiếu của đoạn `index` và ghi vào đúng offset trong file `.part`.
+
+        Nếu có `hasher` (PrefixHasher) thì dữ liệu nối tiếp phần đã băm được băm ngay khi nhận.
+        Lỗi quota/5xx được thử lại qua `drive_scheduler`, mỗi lần tiếp tục từ byte đã nhận.
+        """
+        drive_scheduler.call(self._fetch_range, file_id, part_path, state, index, hasher)
+
+    def _fetch_range(self, file_id, part_path, state, index, hasher=None):
+        start, end, received = state.segments[index]
+        # AuthorizedSession riêng cho từng đoạn: requests.Session không nên dùng chung giữa các luồng
+        session = auth_requests.AuthorizedSession(self._creds)
+        try:
+            with session.get(DRIVE_MEDIA_URL.format(file_id=file_id),
+                             headers={'Range': f'bytes={start + received}-{end}'},
+                             stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code != 206 and (start + received, end) != (0, state.size - 1):
+                    raise IOError(f"Máy chủ không hỗ trợ tải theo đoạn (HTTP {response.status_code})")
+                # os.pwrite không có trên Windows nên mỗi đoạn dùng file handle riêng và seek tới offset.
+                # Việc ghi do luồng ghi đĩa đảm nhận, vòng lặp này chỉ đọc mạng.
+                f = self._writer.open(part_path, start + received)
+                unsaved = 0
+                try:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        self._check_control()
+                        f.write(chunk)
+                        if hasher is not None:
+                            hasher.feed(start + received, chunk)
+                        received += len(chunk)
+                        unsaved += len(chunk)
+                        if unsaved >= STATE_SAVE_INTERVAL:
+                            # Chỉ ghi nhận vào tệp trạng thái khi dữ liệu đã xuống đĩa
+                            f.flush(functools.partial(state.update, index, received))
+                            unsaved = 0
+                            self._emit('bytes_received', id=file_id, received=state.received(), size=state.size)
+                finally:
+                    f.close()
+                    state.update(index, received, force=True)
+        finally:
+            session.close()
+        if start + received != end + 1:
+            raise IOError(f"Đoạn {start}-{end} chỉ nhận được {received} byte")
 
     def extract_folder_id_from_url(self, url):
         pattern = r'[-\w]{25,}'
@@ -468,35 +2897,195 @@ class DownloadFromDrive:
             return match.group(0)
         return None
 
-    def download_from_drive(self, shared_drive_urls, dest_folder):
+    def download_from_drive(self, shared_drive_urls, dest_folder, roots=None):
+        """`roots` là metadata đã lấy lúc kiểm tra link (ID -> (metadata, lỗi)), nếu có."""
         service = self.get_user_credential()  # Lấy quyền truy cập vào Google Drive API
         status_messages = []  
         
-        
+        self._index = SyncIndex(dest_folder)
+        self._writer = DiskWriter()
+        self._dedup = DedupRegistry()
+        if self._listing_ttl > 0:
+            self._listing_cache = ListingCache(self._listing_ttl)
+        if self._workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        if self._async_engine:
+            if not HAS_AIOHTTP:
+                status_messages.append("Chưa cài aiohttp (pip install aiohttp), dùng cách tải thông thường.")
+            else:
+                self._engine = AsyncDriveEngine(self._creds)
+        try:
+            if self._plan_order != PLAN_ORDER_LISTING:
+                self._download_planned(service, shared_drive_urls, dest_folder, status_messages, roots)
+            else:
+                # Thứ tự liệt kê: tải ngay khi liệt kê, giới hạn dung lượng được tính dồn theo từng file
+                if self._limit_size > 0:
+                    self._budget = TransferPlan(self._limit_size * 1024 ** 3)
+                self._download_links(service, shared_drive_urls, dest_folder, status_messages, roots)
+                if self._budget is not None:
+                    print(self._budget.summary())
+                    status_messages.append(self._budget.summary())
+            if self._rehashed_bytes:
+                status_messages.append(f"Kiểm tra MD5 file tải nhiều đoạn: đọc lại "
+                                       f"{self._rehashed_bytes / (1024 * 1024):0.2f} MB từ đĩa.")
+            if self._unverified_files:
+                status_messages.append(f"{self._unverified_files} tệp tải nhiều đoạn không được kiểm tra MD5 "
+                                       f"(đã tắt), chỉ kiểm tra kích thước.")
+        finally:
+            self._budget = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._engine is not None:
+                self._wait_pending()
+                self._engine.close()
+                self._engine = None
+            self._writer.close()
+            self._writer = None
+            self._dedup = None
+            if self._listing_cache is not None:
+                print(self._listing_cache.summary())
+                status_messages.append(self._listing_cache.summary())
+                self._listing_cache.close()
+                self._listing_cache = None
+            self._index.close()
+            self._index = None
+        # Job bị dừng trong lúc các luồng tải đang chạy: các file còn lại đã bỏ dở, không coi là xong
+        self._check_control()
+
+        # Trả về các thông báo đã thu thập
+        return "\n".join(status_messages) if status_messages else gr.Info("Đã tải xong ! Vui lòng bấm nút [ Output folder ] để xem kết quả.", visible=True, duration=2)
+
+    def _download_planned(self, service, shared_drive_urls, dest_folder, status_messages, roots=None):
+        """Liệt kê toàn bộ job trước, lập kế hoạch theo ngân sách dung lượng rồi mới tải."""
+        self._planned = []
+        self._deferred_checkpoints = []
+        try:
+            self._download_links(service, shared_drive_urls, dest_folder, status_messages, roots)
+            candidates = self._planned
+        finally:
+            self._planned = None
+
+        plan = TransferPlan(self._limit_size * 1024 ** 3, self._plan_order)
+        plan.build(candidates)
+        print(plan.summary())
+        status_messages.append(plan.summary())
+        # Báo kế hoạch ngay, trước khi tải byte nào (dòng lệnh và bảng job thấy được file bị bỏ qua)
+        self._emit('plan', message=plan.summary(), selected=plan.selected_count, selected_bytes=plan.selected_bytes,
+                   skipped=plan.skipped_count, skipped_bytes=plan.skipped_bytes,
+                   skipped_files=[os.path.join(folder_path, file['name']) for _, folder_path, file in plan.skipped])
+
+        failed_before = self.progress.files_failed
+        for _, folder_path, file in plan.selected:
+            self._submit_copy(service, folder_path, file)
+        failed = self._wait_pending()
+        # Tạm dừng/hủy giữa chừng không tính là lỗi tệp nhưng cũng không được lưu checkpoint
+        self._check_control()
+        if failed or self.progress.files_failed > failed_before:
+            status_messages.append("Đã tải xong kế hoạch nhưng có tệp bị lỗi, vui lòng thử lại.")
+        elif not plan.skipped:
+            # Checkpoint chỉ được lưu khi mọi file trong kế hoạch đều đã tải
+            for checkpoint in self._deferred_checkpoints:
+                self._index.set_checkpoint(*checkpoint)
+        self._deferred_checkpoints = []
+
+    def _transfer_cost(self, dest_folder, source_file):
+        """Số byte còn phải tải cho file này (0 nếu đã có sẵn trên máy)."""
+        download_path = os.path.join(dest_folder, source_file['name'])
+        size = int(source_file.get('size') or 0)
+        entry = self._index.get(source_file['id'], download_path) if self._index is not None else None
+        if entry is not None:
+            if SyncIndex.is_unchanged(entry, source_file) and os.path.exists(self._index.abspath(entry['path'])):
+                return 0
+        elif os.path.exists(download_path):
+            return 0
+        part_path = download_path + PART_SUFFIX
+        state = PartState.load(part_path + STATE_SUFFIX, source_file['id'], size)
+        if state is not None and os.path.exists(part_path):
+            return size - state.received()
+        return size
+
+    def _download_links(self, service, shared_drive_urls, dest_folder, status_messages, roots=None):
+        # Lấy metadata của mọi link trong vài lượt batch thay vì một lượt gọi cho mỗi link,
+        # bỏ qua những link đã có metadata từ bước kiểm tra
+        roots = dict(roots or {})
+        missing = [source_id for source_id in map(self.extract_folder_id_from_url, shared_drive_urls)
+                   if source_id and source_id not in roots]
+        if missing:
+            roots.update(fetch_drive_metadata(service, missing))
         for drive_url in shared_drive_urls:
+            self._emit('link_started', url=drive_url)
             source_folder_id = self.extract_folder_id_from_url(drive_url)
+            link_failed = False
             if source_folder_id:
+                failed_before = self.progress.files_failed
+                over_budget_before = self._budget.skipped_count if self._budget is not None else 0
                 try:
-                    
-                    source_folder = service.files().get(fileId=source_folder_id, supportsAllDrives=True).execute()
 
-                    if source_folder['mimeType'] == 'application/vnd.google-apps.folder':
+                    source_folder, error = roots[source_folder_id]
+                    if error is not None:
+                        raise error
+                    if source_folder['mimeType'] == SHORTCUT_MIME_TYPE:
+                        # Link tới một lối tắt: tải file/thư mục mà lối tắt trỏ tới
+                        source_folder = resolve_shortcuts(service, [source_folder])[0]
+                        if source_folder is None:
+                            status_messages.append(f"link {drive_url} ---> là lối tắt tới mục không truy cập được.")
+                            self.links_failed += 1
+                            self._emit('link_finished', url=drive_url, message=status_messages[-1], failed=True)
+                            continue
+                        source_folder_id = source_folder['id']
+                    new_page_token = None
+
+                    if source_folder['mimeType'] == FOLDER_MIME_TYPE:
                         
                         root_folder_path = os.path.join(dest_folder, source_folder['name'])
-                        os.makedirs(root_folder_path, exist_ok=True)
-
-                        
-                        self.get_childs_from_folder(service, source_folder_id, root_folder_path)
-
-                        
-                        status_messages.append(f"link {drive_url} ---> đã tải thành công!")
+                        checkpoint = self._index.get_checkpoint(source_folder_id) if self._sync_changes else None
+                        stored_root = self._index.get_folder_path(source_folder_id)
+                        if checkpoint is not None and stored_root not in (None, root_folder_path) \
+                                and os.path.isdir(stored_root) and not os.path.exists(root_folder_path):
+                            # Thư mục gốc đã được đổi tên trên Drive: đổi tên bản trên máy rồi đồng bộ tiếp
+                            self._move_local_folder(stored_root, root_folder_path)
+                        if checkpoint is not None and self._index.get_folder_path(source_folder_id) == root_folder_path \
+                                and os.path.isdir(root_folder_path):
+                            # Đã đồng bộ trước đó: chỉ áp dụng các thay đổi kể từ checkpoint
+                            new_page_token = self._apply_changes(service, checkpoint)
+                        else:
+                            if self._sync_changes:
+                                # Lấy checkpoint trước khi liệt kê để không bỏ sót thay đổi trong lúc tải
+                                new_page_token = drive_scheduler.execute(service.changes().getStartPageToken(
+                                    supportsAllDrives=True, **self._drive_kwargs(source_folder.get('driveId'))
+                                ))['startPageToken']
+                            os.makedirs(root_folder_path, exist_ok=True)
+                            self._index.record_folder(source_folder_id, root_folder_path)
+
+                            self.get_childs_from_folder(service, source_folder_id, root_folder_path,
+                                                        source_folder.get('modifiedTime'))
                     else:
                         
-                        self.copy_file(service, dest_folder, source_folder)
-                        
+                        self._submit_copy(service, dest_folder, source_folder)
+
+                    failed = self._wait_pending()
+                    # Tạm dừng/hủy giữa chừng không tính là lỗi tệp nhưng cũng không được lưu checkpoint
+                    self._check_control()
+                    if failed or self.progress.files_failed > failed_before:
+                        status_messages.append(f"link {drive_url} ---> đã tải xong nhưng có tệp bị lỗi, vui lòng thử lại.")
+                    elif self._planned is not None:
+                        if new_page_token is not None:
+                            self._deferred_checkpoints.append((source_folder_id, new_page_token, source_folder.get('driveId')))
+                        status_messages.append(f"link {drive_url} ---> đã liệt kê xong, sẽ tải theo kế hoạch.")
+                    elif self._budget is not None and self._budget.skipped_count > over_budget_before:
+                        # Checkpoint chỉ được lưu khi mọi file đều đã tải, giống như khi lập kế hoạch trước
+                        status_messages.append(f"link {drive_url} ---> đã tải phần vừa giới hạn dung lượng, "
+                                               f"các tệp còn lại bị bỏ qua.")
+                    else:
+                        if new_page_token is not None:
+                            self._index.set_checkpoint(source_folder_id, new_page_token, source_folder.get('driveId'))
                         status_messages.append(f"link {drive_url} ---> đã tải thành công!")
 
                 except HttpError as e:
+                    # Các file đã đẩy vào pool trước khi lỗi vẫn được tải nốt
+                    self._wait_pending()
+                    link_failed = True
                     # Xử lý lỗi khi không tìm thấy file hoặc folder, hoặc bị khóa quyền truy cập
                     if "notFound" in str(e):
                         status_messages.append(f"link {drive_url} ---> bị lỗi khi truy cập, vui lòng kiểm tra lại.")
@@ -507,15 +3096,20 @@ class DownloadFromDrive:
             else:
                 # Nếu không phải là link Google Drive hợp lệ
                 status_messages.append(f"link {drive_url}---> không phải link google drive, vui lòng kiểm tra lại!")
+                link_failed = True
+            if link_failed:
+                self.links_failed += 1
+            self._emit('link_finished', url=drive_url, message=status_messages[-1], failed=link_failed)
 
-        # Trả về các thông báo đã thu thập
-        return "\n".join(status_messages) if status_messages else gr.Info("Đã tải xong ! Vui lòng bấm nút [ Output folder ] để xem kết quả.", visible=True, duration=2)
 
 
-
-def start_download(shared_drive_links, max_size):
+def start_download(shared_drive_links, max_size, workers=DEFAULT_DOWNLOAD_WORKERS,
+                   segments=DEFAULT_SEGMENT_COUNT, segment_threshold_mb=DEFAULT_SEGMENT_THRESHOLD_MB,
+                   sync_changes=False, plan_order=PLAN_ORDER_LISTING, async_engine=False, filter_spec=None,
+                   listing_ttl_min=DEFAULT_LISTING_TTL_MIN, dest_folder=None, control=None, events=None,
+                   verify_segmented=True):
     global download_folder_path
-    global status_messages
+    # Biến cục bộ: nhiều job có thể chạy cùng lúc trong JobManager
     status_messages = []  
 
     
@@ -525,8 +3119,14 @@ def start_download(shared_drive_links, max_size):
     seen_links = set()
     
     
-    downloader = DownloadFromDrive()
-    downloader._limit_size = float(max_size)
+    downloader = DownloadFromDrive(workers=int(workers or 1), segments=int(segments or 1),
+                                   segment_threshold_mb=float(segment_threshold_mb or DEFAULT_SEGMENT_THRESHOLD_MB),
+                                   sync_changes=bool(sync_changes), plan_order=plan_order or PLAN_ORDER_LISTING,
+                                   async_engine=bool(async_engine), filter_spec=filter_spec,
+                                   listing_ttl_min=float(listing_ttl_min or 0), control=control, events=events,
+                                   verify_segmented=bool(verify_segmented))
+    downloader._limit_size = float(max_size or 0)
+    unique_links = []
     
     
     for link in shared_drive_links:
@@ -536,29 +3136,49 @@ def start_download(shared_drive_links, max_size):
             continue
 
         seen_links.add(link)  
-        
-        
-        valid, message = validate_url(link)
-        if not valid:
-            status_messages.append(message)  # Nếu không hợp lệ, thêm thông báo lỗi
-        else:
-            
-            download_result = downloader.download_from_drive([link], download_folder_path)
-            status_messages.append(download_result)  
-    
+        unique_links.append(link)
+
+    # Kiểm tra tất cả link cùng lúc; thông báo lỗi được thêm cho các link không hợp lệ
+    valid_links, messages, roots = validate_links(downloader.service, unique_links)
+    status_messages.extend(messages)
+
+    # Tải tất cả link trong một lần để giới hạn dung lượng áp dụng cho cả job
+    if valid_links:
+        download_result = downloader.download_from_drive(valid_links, dest_folder or download_folder_path, roots)
+        status_messages.append(download_result)  
     
+    status_messages.append(downloader.progress.summary())
+    status_messages.append(drive_scheduler.summary())
     return "\n".join(status_messages)
 
 
 
-def start_download_with_validation(shared_drive_links, max_size, folder_path):
+def start_download_with_validation(shared_drive_links, max_size, folder_path, workers=DEFAULT_DOWNLOAD_WORKERS,
+                                   segments=DEFAULT_SEGMENT_COUNT, segment_threshold_mb=DEFAULT_SEGMENT_THRESHOLD_MB,
+                                   sync_changes=False, plan_order=PLAN_ORDER_LISTING, async_engine=False,
+                                   listing_ttl_min=DEFAULT_LISTING_TTL_MIN, verify_segmented=True, priority=1,
+                                   *filter_fields):
         # Kiểm tra đầu vào
         is_valid, validation_message = validate_inputs(shared_drive_links, folder_path)
         if not is_valid:
             return validation_message  
+        try:
+            FilterSpec.parse(*filter_fields)
+        except ValueError as e:
+            return str(e)
         
-        # Nếu hợp lệ, tiếp tục tải xuống
-        return start_download(shared_drive_links, max_size)
+        # Nếu hợp lệ, đưa vào hàng đợi: việc tải chạy nền, tiến độ hiện trong bảng job
+        params = {'shared_drive_links': shared_drive_links, 'max_size': max_size, 'dest_folder': folder_path,
+                  'workers': workers, 'segments': segments, 'segment_threshold_mb': segment_threshold_mb,
+                  'sync_changes': bool(sync_changes), 'plan_order': plan_order, 'async_engine': bool(async_engine),
+                  'listing_ttl_min': listing_ttl_min, 'verify_segmented': bool(verify_segmented),
+                  'filter_fields': list(filter_fields)}
+        manager = get_job_manager()
+        duplicate = manager.find_active(params)
+        if duplicate is not None:
+            return f"Các link này đang được tải trong job #{duplicate.id} ({JOB_STATUS_LABELS[duplicate.status]})."
+        job = manager.submit(params, int(priority if priority is not None else 1))
+        return f"Đã thêm job #{job.id} vào hàng đợi. Theo dõi tiến độ trong bảng Hàng đợi tải."
 
 def open_output_folder_with_validation(folder_path):
         # Kiểm tra xem người dùng đã chọn thư mục tải về chưa
@@ -570,12 +3190,47 @@ def open_output_folder_with_validation(folder_path):
         return "Thư mục tải về đã được mở!"
 
 
+def verify_existing(dest_folder, workers=None):
+    """Kiểm tra MD5 của các file đã tải (theo chỉ mục) song song trên nhiều nhân CPU.
+
+    File hỏng được ghi MD5 thực tế vào chỉ mục nên lần tải sau sẽ tự tải lại.
+    """
+    if not os.path.exists(os.path.join(dest_folder, INDEX_FILE_NAME)):
+        return "Thư mục này chưa có chỉ mục tải về, không có gì để kiểm tra."
+
+    index = SyncIndex(dest_folder)
+    try:
+        entries = [entry for entry in index.entries() if entry['md5']]
+        present = [entry for entry in entries if os.path.exists(index.abspath(entry['path']))]
+        corrupt = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            digests = pool.map(file_md5, [index.abspath(entry['path']) for entry in present], chunksize=8)
+            for entry, digest in zip(present, digests):
+                if digest != entry['md5']:
+                    corrupt.append(entry['path'])
+                    index.set_md5(entry['file_id'], digest, entry['path'])
+    finally:
+        index.close()
+
+    message = (f"Đã kiểm tra {len(present)} tệp: {len(present) - len(corrupt)} tệp đúng MD5, "
+               f"{len(corrupt)} tệp bị hỏng, {len(entries) - len(present)} tệp bị thiếu.")
+    if corrupt:
+        message += "\nCác tệp hỏng (sẽ được tải lại ở lần tải sau): " + ", ".join(corrupt)
+    return message
+
+def verify_existing_with_validation(folder_path):
+        if not folder_path or folder_path == "No folder selected.":
+            return "Vui lòng chọn thư mục tải về!"
+        return verify_existing(folder_path)
+
+
 def check_and_extract_folder_id(destination_folder_link):
     uploader = UploadToDrive()  # Khởi tạo dịch vụ
-    folder_id = uploader.extract_folder_id_from_url(destination_folder_link)
+    folder_id, message = uploader.check_folder_link(destination_folder_link)
     if folder_id:
-        return f"Thư mục hợp lệ, ID: {folder_id}"
-    return "Liên kết thư mục không hợp lệ hoặc không có quyền truy cập."
+        return f"{message} ID: {folder_id}"
+    # Thông báo cụ thể: link trống/sai định dạng, thư mục không tồn tại hoặc không có quyền
+    return message
 
 def upload_files_to_drive(destination_folder_link):
     
@@ -603,7 +3258,27 @@ def upload_files_to_drive(destination_folder_link):
     folder_link = f"https://drive.google.com/drive/folders/{folder_id}?usp=sharing"
     return f"Tất cả các tệp đã được tải lên thành công vào thư mục đích!\nVui lòng xem kết quả tại đây: {folder_link}"
 
-def upload_folder_to_drive(destination_folder_link):
+def clone_folder_to_drive(source_link, destination_folder_link, workers=DEFAULT_DOWNLOAD_WORKERS, async_engine=False,
+                          *filter_fields):
+    if not source_link or not source_link.strip():
+        return "Vui lòng nhập link thư mục chia sẻ cần sao chép."
+    try:
+        filter_spec = FilterSpec.parse(*filter_fields)
+    except ValueError as e:
+        return str(e)
+
+    uploader = UploadToDrive()
+    folder_id = uploader.extract_folder_id_from_url(destination_folder_link)
+    if not folder_id:
+        return "Liên kết thư mục không hợp lệ hoặc không có quyền truy cập. Vui lòng kiểm tra lại URL."
+
+    try:
+        return uploader.clone_folder(source_link.strip(), folder_id, int(workers or 1), bool(async_engine), filter_spec)
+    except HttpError as e:
+        return f"Đã xảy ra lỗi với link {source_link}: {str(e)}"
+
+def upload_folder_to_drive(destination_folder_link, workers=DEFAULT_UPLOAD_WORKERS, sync_upload=False,
+                           async_engine=False):
     uploader = UploadToDrive()
     folder_id = uploader.extract_folder_id_from_url(destination_folder_link)
 
@@ -617,65 +3292,637 @@ def upload_folder_to_drive(destination_folder_link):
         return "Không có thư mục nào được chọn."
 
     # Tiến hành upload thư mục
-    return uploader.upload_folder(folder_path, folder_id)
+    return uploader.upload_folder(folder_path, folder_id, int(workers or 1), sync=bool(sync_upload),
+                                  async_engine=bool(async_engine))
 
 
 
     
 
 
-initialize_uploader()
+class Job:
+    """Một lần tải trong hàng đợi: tham số (lưu được ra JSON), trạng thái và tiến độ hiện tại."""
+    def __init__(self, job_id, params, priority=1, created=None):
+        self.id = job_id
+        self.params = params
+        self.priority = priority
+        self.created = created or time.time()
+        self.status = JOB_QUEUED
+        self.message = ""
+        self.current = ""
+        self._current_name = ""
+        self.plan = ""  # Tóm tắt kế hoạch tải (giới hạn dung lượng), có ngay trước khi tải
+        self.control = JobControl()
+        self.progress = TransferProgress()
+
+    def record_event(self, event, **fields):
+        """Nhận sự kiện tiến độ từ DownloadFromDrive để bảng job hiển thị trong lúc đang tải."""
+        if event == 'plan':
+            self.plan = self.current = fields['message']
+        elif event == 'file_started':
+            self._current_name = self.current = os.path.basename(fields['path'])
+        elif event == 'bytes_received' and fields.get('size'):
+            self.current = f"{self._current_name} ({fields['received'] * 100 // fields['size']}%)"
+        elif event == 'file_finished':
+            self.progress.add_done(fields.get('bytes', 0))
+        elif event == 'file_skipped':
+            self.progress.add_skipped()
+        elif event == 'file_linked':
+            self.progress.add_linked(fields.get('bytes', 0))
+        elif event == 'file_failed':
+            self.progress.add_failed(os.path.basename(fields.get('path', '')))
+
+    def row(self):
+        progress = self.progress.as_dict()
+        summary = (f"{progress['files_done']} tệp ({progress['bytes_done'] / (1024 * 1024):0.1f} MB), "
+                   f"{progress['files_skipped'] + progress['files_linked']} bỏ qua/liên kết, {progress['files_failed']} lỗi")
+        if self.status == JOB_RUNNING:
+            detail = self.current
+        else:
+            lines = self.message.splitlines()
+            detail = lines[0] if lines else ""
+            if len(lines) > 1:
+                detail += f" (+{len(lines) - 1} dòng, xem Chi tiết job)"
+        return [self.id, JOB_PRIORITIES.get(self.priority, self.priority), JOB_STATUS_LABELS[self.status], summary, detail]
+
+    def details(self):
+        """Toàn bộ kết quả của job: thông báo từng link, tệp lỗi, tổng kết (như ô Trạng thái trước đây)."""
+        links = self.params.get('shared_drive_links', '').replace("\n", ",").split(",")
+        lines = [f"Job #{self.id} - {JOB_STATUS_LABELS[self.status]}",
+                 "Link: " + ", ".join(link.strip() for link in links if link.strip())]
+        if self.status == JOB_RUNNING:
+            if self.plan:
+                lines.append(self.plan)
+            lines.append(f"Đang tải: {self.current}")
+            lines.append(self.progress.summary())
+        if self.message:
+            lines.append(self.message)
+        return "\n".join(lines)
+
+
+class JobManager:
+    """Hàng đợi ưu tiên các job tải chạy nền, tối đa `concurrency` job cùng lúc.
+
+    Mọi thay đổi được ghi thêm vào nhật ký JSON lines (`journal_path`). Khi khởi động lại, job
+    đang chờ hoặc đang chạy dở được đưa lại vào hàng đợi và tải tiếp nhờ file `.part`/chỉ mục.
+    """
+    def __init__(self, runner, journal_path=JOBS_JOURNAL_FILE, concurrency=DEFAULT_CONCURRENT_JOBS):
+        self._runner = runner  # runner(job) chạy job trong luồng nền, trả về thông báo kết quả
+        self._journal_path = journal_path
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._queue = []  # heap (độ ưu tiên, thứ tự thêm, ID job)
+        self._order = 0
+        self._concurrency = max(1, int(concurrency))
+        self._workers = 0
+        with self._cond:
+            self._load_journal()
+            self._spawn_locked()
+
+    def _append(self, record):
+        # fsync từng dòng: dòng cuối có thể dở dang khi mất điện, lúc đọc lại sẽ được bỏ qua
+        with open(self._journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _records(job):
+        return [{'op': 'submit', 'id': job.id, 'params': job.params, 'priority': job.priority, 'created': job.created},
+                {'op': 'status', 'id': job.id, 'status': job.status, 'message': job.message}]
+
+    def _load_journal(self):
+        """Dựng lại các job từ nhật ký, đưa job chưa xong vào hàng đợi rồi ghi gọn lại nhật ký."""
+        try:
+            with open(self._journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('op') == 'submit':
+                self._jobs[record['id']] = Job(record['id'], record['params'], record['priority'], record['created'])
+            elif record.get('op') == 'status' and record['id'] in self._jobs:
+                job = self._jobs[record['id']]
+                job.status, job.message = record['status'], record.get('message', "")
+
+        finished = [job for job in self._jobs.values() if job.status in (JOB_CANCELLED, JOB_DONE, JOB_FAILED)]
+        for job in finished[:-JOB_HISTORY_LIMIT]:
+            del self._jobs[job.id]
+        for job in self._jobs.values():
+            if job.status in (JOB_QUEUED, JOB_RUNNING):
+                if job.status == JOB_RUNNING:
+                    job.message = "Tiếp tục sau khi ứng dụng khởi động lại."
+                job.status = JOB_QUEUED
+                self._push_locked(job)
+
+        tmp_path = self._journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for job in self._jobs.values():
+                for record in self._records(job):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._journal_path)
+
+    def _push_locked(self, job):
+        self._order += 1
+        heapq.heappush(self._queue, (job.priority, self._order, job.id))
+        self._cond.notify_all()
+
+    def _set_status_locked(self, job, status, message=None):
+        job.status = status
+        if message is not None:
+            job.message = message
+        self._append({'op': 'status', 'id': job.id, 'status': status, 'message': job.message})
+        self._cond.notify_all()
+
+    def _spawn_locked(self):
+        while self._workers < self._concurrency:
+            self._workers += 1
+            threading.Thread(target=self._work, name=f"job-worker-{self._workers}", daemon=True).start()
+
+    def submit(self, params, priority=1):
+        with self._cond:
+            job = Job(max(self._jobs, default=0) + 1, params, priority)
+            self._jobs[job.id] = job
+            self._append(self._records(job)[0])
+            self._push_locked(job)
+            return job
+
+    def find_active(self, params):
+        """Job chưa kết thúc có cùng link và thư mục tải về, nếu có."""
+        with self._cond:
+            return next((job for job in self._jobs.values()
+                         if job.status in (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED)
+                         and job.params.get('shared_drive_links') == params.get('shared_drive_links')
+                         and job.params.get('dest_folder') == params.get('dest_folder')), None)
+
+    def set_concurrency(self, concurrency):
+        with self._cond:
+            self._concurrency = max(1, int(concurrency or 1))
+            self._spawn_locked()
+            # Luồng thừa tự thoát khi rảnh; job đang chạy không bị ngắt
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if self._workers > self._concurrency:
+                        self._workers -= 1
+                        return
+                    while self._queue and job is None:
+                        _, _, job_id = heapq.heappop(self._queue)
+                        if self._jobs.get(job_id) is not None and self._jobs[job_id].status == JOB_QUEUED:
+                            job = self._jobs[job_id]
+                    if job is None:
+                        self._cond.wait()
+                job.control = JobControl()
+                job.progress = TransferProgress()
+                job.current = job.plan = ""
+                self._set_status_locked(job, JOB_RUNNING, "")
+
+            try:
+                status, message = JOB_DONE, self._runner(job)
+            except JobInterrupted as e:
+                status, message = e.args[0], "Đã tạm dừng, bấm Tiếp tục để tải tiếp." if e.args[0] == JOB_PAUSED else "Đã hủy."
+            except Exception as e:
+                status, message = JOB_FAILED, f"Đã xảy ra lỗi: {e}"
+            with self._cond:
+                self._set_status_locked(job, status, message or "")
+
+    def _get(self, job_id):
+        job = self._jobs.get(int(job_id or 0))
+        if job is None:
+            raise KeyError(f"Không tìm thấy job #{job_id}.")
+        return job
+
+    def pause(self, job_id):
+        with self._cond:
+            job = self._get(job_id)
+            if job.status == JOB_QUEUED:
+                self._set_status_locked(job, JOB_PAUSED, "Đã tạm dừng.")
+            elif job.status == JOB_RUNNING:
+                # Dừng ở chunk kế tiếp; phần đã tải được giữ lại để tải tiếp
+                job.control.stop(JOB_PAUSED)
+            else:
+                return f"Job #{job.id} đang ở trạng thái {JOB_STATUS_LABELS[job.status]}, không tạm dừng được."
+            return f"Đang tạm dừng job #{job.id}."
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self._get(job_id)
+            if job.status not in (JOB_PAUSED, JOB_FAILED):
+                return f"Job #{job.id} đang ở trạng thái {JOB_STATUS_LABELS[job.status]}, không cần tiếp tục."
+            self._set_status_locked(job, JOB_QUEUED, "")
+            self._push_locked(job)
+            return f"Đã đưa job #{job.id} trở lại hàng đợi."
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._get(job_id)
+            if job.status in (JOB_QUEUED, JOB_PAUSED):
+                self._set_status_locked(job, JOB_CANCELLED, "Đã hủy.")
+            elif job.status == JOB_RUNNING:
+                job.control.stop(JOB_CANCELLED)
+            else:
+                return f"Job #{job.id} đã kết thúc."
+            return f"Đang hủy job #{job.id}."
+
+    def details(self, job_id):
+        with self._cond:
+            return self._get(job_id).details()
+
+    def rows(self):
+        with self._cond:
+            return [job.row() for job in sorted(self._jobs.values(), key=lambda job: job.id, reverse=True)]
+
+
+def run_download_job(job):
+    """Chạy một job tải trong luồng của JobManager."""
+    params = job.params
+    return start_download(params['shared_drive_links'], params['max_size'], params['workers'], params['segments'],
+                          params['segment_threshold_mb'], params['sync_changes'], params['plan_order'],
+                          params['async_engine'], FilterSpec.parse(*params['filter_fields']),
+                          params['listing_ttl_min'], dest_folder=params['dest_folder'],
+                          control=job.control, events=job.record_event,
+                          verify_segmented=params.get('verify_segmented', True))
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """JobManager dùng chung của ứng dụng; lần đầu gọi sẽ đọc nhật ký và chạy tiếp các job dở dang."""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(run_download_job)
+        return _job_manager
+
+
+def list_jobs():
+    return get_job_manager().rows()
+
+
+def control_job(action, job_id):
+    try:
+        return getattr(get_job_manager(), action)(job_id)
+    except KeyError as e:
+        return e.args[0]
+    except (ValueError, TypeError):
+        return "Vui lòng nhập số job hợp lệ."
+
+
+def job_details(job_id):
+    if not job_id:
+        return ""
+    try:
+        return get_job_manager().details(job_id)
+    except KeyError as e:
+        return e.args[0]
+    except (ValueError, TypeError):
+        return "Vui lòng nhập số job hợp lệ."
+
+
+def refresh_jobs(job_id):
+    return list_jobs(), job_details(job_id)
+
+
+def set_concurrent_jobs(concurrency):
+    get_job_manager().set_concurrency(concurrency)
+    return f"Số job chạy cùng lúc: {max(1, int(concurrency or 1))}."
+
+
+def read_links(sources):
+    """Đọc link từ các tệp (`-` là stdin): mỗi dòng một hoặc nhiều link cách nhau bởi dấu phẩy, bỏ dòng `#`."""
+    links = []
+    for source in sources:
+        stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+        try:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    links.extend(link.strip() for link in line.split(",") if link.strip())
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    return links
+
+
+def cli_filter(args):
+    return FilterSpec.parse(",".join(args.include), ",".join(args.exclude), ",".join(args.ext),
+                            ",".join(args.mime), args.min_size_mb, args.max_size_mb, args.modified_after)
+
+
+def add_filter_arguments(parser):
+    group = parser.add_argument_group("bộ lọc file")
+    group.add_argument("--include", action="append", default=[], help="Chỉ lấy file có tên khớp glob/chuỗi này")
+    group.add_argument("--exclude", action="append", default=[], help="Bỏ file/thư mục có tên khớp glob/chuỗi này")
+    group.add_argument("--ext", action="append", default=[], help="Chỉ lấy file có đuôi này (pdf, .mp4...)")
+    group.add_argument("--mime", action="append", default=[], help="Chỉ lấy file có MIME type này (application/pdf, video/*)")
+    group.add_argument("--min-size-mb", type=float, default=None, help="Bỏ file nhỏ hơn (MB)")
+    group.add_argument("--max-size-mb", type=float, default=None, help="Bỏ file lớn hơn (MB)")
+    group.add_argument("--modified-after", default="", help="Chỉ lấy file sửa sau ngày này (YYYY-MM-DD)")
+
+
+def cli_download(args, events):
+    links = list(dict.fromkeys(args.links + read_links(args.input)))
+    if args.verify_existing:
+        message = verify_existing(args.dest)
+        print(message)
+        events('verify_finished', message=message)
+
+    downloader = DownloadFromDrive(workers=args.workers, segments=args.segments,
+                                   segment_threshold_mb=args.segment_threshold_mb, sync_changes=args.sync_changes,
+                                   plan_order=args.plan_order, async_engine=args.async_engine, events=events,
+                                   filter_spec=cli_filter(args), listing_ttl_min=args.listing_ttl_min,
+                                   verify_segmented=not args.skip_segmented_md5)
+    downloader._limit_size = args.max_size
+    valid_links, messages, roots = validate_links(downloader.service, links)
+    for message in messages:
+        print(message)
+    events('links_validated', total=len(links), valid=len(valid_links), invalid=messages)
+    links_failed = len(links) - len(valid_links)
+    if valid_links:
+        print(downloader.download_from_drive(valid_links, args.dest, roots))
+        links_failed += downloader.links_failed
+    events('summary', **downloader.progress.as_dict(), links_failed=links_failed, drive_api=drive_scheduler.stats())
+    return 1 if downloader.progress.files_failed or links_failed else 0
+
+
+def cli_upload(args, events):
+    uploader = UploadToDrive(events=events)
+    folder_id = uploader.extract_folder_id_from_url(args.dest_link)
+    if not folder_id:
+        events('error', message="Liên kết thư mục đích không hợp lệ hoặc không có quyền truy cập.")
+        events('summary', **TransferProgress().as_dict(), links_failed=1, drive_api=drive_scheduler.stats())
+        return 2
+
+    # Mọi thư mục và file lẻ cộng dồn vào cùng một tiến độ để sự kiện `summary` cuối cùng đầy đủ
+    progress = TransferProgress()
+    links_failed = 0
+    files = [path for path in args.paths if os.path.isfile(path)]
+    for folder_path in [path for path in args.paths if os.path.isdir(path)]:
+        try:
+            print(uploader.upload_folder(os.path.normpath(folder_path), folder_id, args.workers, sync=args.sync,
+                                         async_engine=args.async_engine, progress=progress))
+        except HttpError as e:
+            links_failed += 1
+            print(f"Đã xảy ra lỗi với thư mục {folder_path}: {e}")
+            events('file_failed', path=folder_path, error=str(e))
+    if files:
+        uploader.upload_files(files, folder_id, args.workers, progress=progress)
+    for path in [path for path in args.paths if not os.path.exists(path)]:
+        progress.add_failed(path)
+        events('file_failed', path=path, error="Không tìm thấy tệp/thư mục")
+    events('summary', **progress.as_dict(), links_failed=links_failed, drive_api=drive_scheduler.stats())
+    return 1 if progress.files_failed or links_failed else 0
+
+
+def cli_clone(args, events):
+    uploader = UploadToDrive(events=events)
+    folder_id = uploader.extract_folder_id_from_url(args.dest_link)
+    if not folder_id:
+        events('error', message="Liên kết thư mục đích không hợp lệ hoặc không có quyền truy cập.")
+        events('summary', **TransferProgress().as_dict(), links_failed=1, drive_api=drive_scheduler.stats())
+        return 2
+    progress = TransferProgress()
+    links_failed = 0
+    for source_link in list(dict.fromkeys(args.links + read_links(args.input))):
+        events('link_started', url=source_link)
+        failed = extract_drive_id(source_link) is None
+        try:
+            message = uploader.clone_folder(source_link, folder_id, args.workers, args.async_engine, cli_filter(args),
+                                            progress=progress)
+        except HttpError as e:
+            failed = True
+            message = f"Đã xảy ra lỗi với link {source_link}: {str(e)}"
+        links_failed += failed
+        print(message)
+        events('link_finished', url=source_link, message=message, failed=failed)
+    events('summary', **progress.as_dict(), links_failed=links_failed, drive_api=drive_scheduler.stats())
+    return 1 if progress.files_failed or links_failed else 0
+
+
+def cli_invalidate_cache(args, events):
+    message = invalidate_listing_cache(",".join(args.links))
+    print(message)
+    events('cache_invalidated', message=message)
+    events('summary', message=message)
+    return 0
+
+
+def cli_verify(args, events):
+    message = verify_existing(args.dest, args.workers)
+    print(message)
+    events('verify_finished', message=message)
+    events('summary', message=message)
+    return 0
+
+
+def run_cli(argv):
+    """Chế độ dòng lệnh không giao diện: sự kiện tiến độ dạng JSON lines ra stdout, thông báo ra stderr."""
+    parser = argparse.ArgumentParser(prog="app.py",
+                                     description="Tải/tải lên Google Drive không cần giao diện. "
+                                                 "Tiến độ được in ra stdout dạng JSON lines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="Tải file/thư mục từ các link Google Drive về máy")
+    download.add_argument("links", nargs="*", help="Các link Google Drive")
+    download.add_argument("-i", "--input", action="append", default=[],
+                          help="Tệp danh sách link, mỗi dòng một link ('-' là stdin); dùng được nhiều lần")
+    download.add_argument("-o", "--dest", required=True, help="Thư mục tải về")
+    download.add_argument("--workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS, help="Số luồng tải song song")
+    download.add_argument("--segments", type=int, default=DEFAULT_SEGMENT_COUNT, help="Số đoạn tải song song cho file lớn")
+    download.add_argument("--segment-threshold-mb", type=float, default=DEFAULT_SEGMENT_THRESHOLD_MB,
+                          help="Tải theo đoạn với file từ kích thước này (MB)")
+    download.add_argument("--skip-segmented-md5", action="store_true",
+                          help="Không kiểm tra MD5 file tải nhiều đoạn (tránh đọc lại phần sau đoạn đầu từ đĩa)")
+    download.add_argument("--max-size", type=float, default=0, help="Dung lượng tải tối đa (GB), 0 là không giới hạn")
+    download.add_argument("--plan-order", default=PLAN_ORDER_LISTING,
+                          choices=[PLAN_ORDER_LISTING, PLAN_ORDER_SMALLEST, PLAN_ORDER_LARGEST])
+    download.add_argument("--sync-changes", action="store_true", help="Chỉ tải/xóa phần đã thay đổi kể từ lần trước")
+    download.add_argument("--async-engine", action="store_true", help="Dùng engine asyncio cho file nhỏ (cần aiohttp)")
+    download.add_argument("--verify-existing", action="store_true",
+                          help="Kiểm tra MD5 các file đã tải trước khi tải, file hỏng sẽ được tải lại")
+    download.add_argument("--listing-ttl-min", type=float, default=DEFAULT_LISTING_TTL_MIN,
+                          help="Dùng lại danh sách thư mục đã liệt kê trong bấy nhiêu phút (mặc định 0 là tắt; có thể bỏ sót file mới trong thời gian này)")
+    add_filter_arguments(download)
+    download.set_defaults(handler=cli_download)
+
+    upload = commands.add_parser("upload", help="Tải file/thư mục trên máy lên một thư mục Google Drive")
+    upload.add_argument("paths", nargs="+", help="Các file hoặc thư mục cần tải lên")
+    upload.add_argument("-d", "--dest-link", required=True, help="Link thư mục Google Drive đích")
+    upload.add_argument("--workers", type=int, default=DEFAULT_UPLOAD_WORKERS, help="Số luồng tải lên song song")
+    upload.add_argument("--sync", action="store_true", help="Bỏ qua tệp giống hệt, cập nhật tệp đã thay đổi")
+    upload.add_argument("--async-engine", action="store_true", help="Dùng engine asyncio cho file nhỏ (cần aiohttp)")
+    upload.set_defaults(handler=cli_upload)
+
+    clone = commands.add_parser("clone", help="Sao chép thư mục chia sẻ thẳng vào thư mục Google Drive đích")
+    clone.add_argument("links", nargs="*", help="Các link thư mục chia sẻ")
+    clone.add_argument("-i", "--input", action="append", default=[], help="Tệp danh sách link ('-' là stdin)")
+    clone.add_argument("-d", "--dest-link", required=True, help="Link thư mục Google Drive đích")
+    clone.add_argument("--workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS, help="Số yêu cầu sao chép song song")
+    clone.add_argument("--async-engine", action="store_true", help="Dùng engine asyncio (cần aiohttp)")
+    add_filter_arguments(clone)
+    clone.set_defaults(handler=cli_clone)
+
+    verify = commands.add_parser("verify", help="Kiểm tra MD5 các file đã tải trong một thư mục")
+    verify.add_argument("dest", help="Thư mục tải về")
+    verify.add_argument("--workers", type=int, default=None, help="Số tiến trình băm song song")
+    verify.set_defaults(handler=cli_verify)
+
+    invalidate = commands.add_parser("invalidate-cache", help="Xóa cache danh sách thư mục")
+    invalidate.add_argument("links", nargs="*", help="Chỉ xóa cache của các thư mục này (mặc định: xóa hết)")
+    invalidate.set_defaults(handler=cli_invalidate_cache)
+
+    args = parser.parse_args(argv)
+    if hasattr(args, 'include'):
+        try:
+            cli_filter(args)
+        except ValueError as e:
+            parser.error(str(e))
+    events = JsonLinesEvents(sys.stdout)
+    # Mọi print() dành cho người đọc chuyển sang stderr để stdout chỉ chứa JSON lines
+    with contextlib.redirect_stdout(sys.stderr):
+        return args.handler(args, events)
+
 
 # Gradio Interface
-with gr.Blocks(title="Google Drive Upload/Download - Andy 0908231181") as demo:
-    gr.HTML("<h1><center>🦟 Donation Momo/zalo pay/VNpay: 0908231181 🦟 </center></h1>")
-    gr.HTML("<h1><center>1. Tải file/folder từ Google Drive bất kì về máy tính (Windows/Mac OS) </center></h1>") 
+def build_ui():
+    with gr.Blocks(title="Google Drive Upload/Download - Andy 0908231181") as demo:
+        gr.HTML("<h1><center>🦟 Donation Momo/zalo pay/VNpay: 0908231181 🦟 </center></h1>")
+        gr.HTML("<h1><center>1. Tải file/folder từ Google Drive bất kì về máy tính (Windows/Mac OS) </center></h1>") 
     
-    shared_drive_links = gr.Textbox(label="Nhập các dòng link Google Drive: ", placeholder="Tối đa 10 link thôi nha !", lines=2)
+        shared_drive_links = gr.Textbox(label="Nhập các dòng link Google Drive: ", placeholder="Tối đa 10 link thôi nha !", lines=2)
     
     
-    with gr.Row():
-        with gr.Column(scale=8):
-            folder_path = gr.Textbox(label="Chọn thư mục tải về", interactive=False, visible=True)
-        with gr.Column(scale=1):
-            browse_button = gr.Button("Duyệt thư mục")
-            output_folder_button = gr.Button("Mở thư mục tải về")
-
-    with gr.Row():
-        with gr.Column(scale=8): download_button = gr.Button("Tải xuống", variant="primary")  
-        with gr.Column(scale=2): max_size = gr.Textbox(label="Dung lượng tải tối đa (GB)", value="700", placeholder="Nhập tổng dung lượng tối đa (Gb) tải về") 
-        with gr.Column(scale=2): delete_button = gr.Button("Xóa API Key")
+        with gr.Row():
+            with gr.Column(scale=8):
+                folder_path = gr.Textbox(label="Chọn thư mục tải về", interactive=False, visible=True)
+            with gr.Column(scale=1):
+                browse_button = gr.Button("Duyệt thư mục")
+                output_folder_button = gr.Button("Mở thư mục tải về")
+                verify_button = gr.Button("Kiểm tra MD5 tệp đã tải")
+
+        with gr.Row():
+            with gr.Column(scale=8): download_button = gr.Button("Tải xuống", variant="primary")  
+            with gr.Column(scale=2): max_size = gr.Textbox(label="Dung lượng tải tối đa (GB)", value="700", placeholder="Nhập tổng dung lượng tối đa (Gb) tải về") 
+            with gr.Column(scale=2): workers = gr.Number(label="Số luồng tải song song", value=DEFAULT_DOWNLOAD_WORKERS, precision=0, minimum=1)
+            with gr.Column(scale=2): delete_button = gr.Button("Xóa API Key")
           
     
-    output_message = gr.Textbox(label="Trạng thái Tải về", lines=3)
-
-    gr.HTML("<h1><center>2. Tải file/folder lên Google Drive của bạn </center></h1>") 
-
-    destination_folder_link = gr.Textbox(label="Link thư mục Google Drive đích:", placeholder="Nhập link thư mục Google Drive đích")
-
-    with gr.Row():
-        with gr.Column(scale=5): upload_file_button = gr.Button("Tải tệp lên")
-        with gr.Column(scale=5):upload_folder_button = gr.Button("Tải thư mục lên")
+        with gr.Accordion("Tùy chọn nâng cao", open=False):
+            with gr.Row():
+                segments = gr.Number(label="Số đoạn tải song song cho file lớn", value=DEFAULT_SEGMENT_COUNT, precision=0, minimum=1)
+                segment_threshold_mb = gr.Number(label="Tải theo đoạn với file từ (MB)", value=DEFAULT_SEGMENT_THRESHOLD_MB, minimum=1)
+                plan_order = gr.Dropdown(label="Thứ tự tải (lập kế hoạch trước khi tải)", value=PLAN_ORDER_LISTING,
+                                         choices=[("Theo thứ tự liệt kê", PLAN_ORDER_LISTING),
+                                                  ("File nhỏ trước", PLAN_ORDER_SMALLEST),
+                                                  ("File lớn trước", PLAN_ORDER_LARGEST)])
+                sync_changes = gr.Checkbox(label="Đồng bộ thay đổi: lần sau chỉ tải/xóa phần đã thay đổi trên Drive", value=False)
+                async_engine = gr.Checkbox(label="Engine asyncio cho rất nhiều file nhỏ (cần cài aiohttp)", value=False)
+                verify_segmented = gr.Checkbox(label="Kiểm tra MD5 file tải nhiều đoạn (đọc lại phần sau đoạn đầu từ đĩa)", value=True)
+            with gr.Row():
+                listing_ttl = gr.Number(label="Dùng lại danh sách thư mục đã liệt kê trong (phút, 0 = tắt)", value=DEFAULT_LISTING_TTL_MIN, minimum=0)
+                invalidate_cache_button = gr.Button("Xóa cache danh sách thư mục")
+
+        with gr.Accordion("Bộ lọc file (khi tải về và khi sao chép thư mục)", open=False):
+            with gr.Row():
+                include_names = gr.Textbox(label="Chỉ lấy tên khớp", placeholder="vd: *bao cao*, chuong_??.mp4")
+                exclude_names = gr.Textbox(label="Bỏ qua tên khớp (cả thư mục)", placeholder="vd: sample, *.tmp")
+                extensions = gr.Textbox(label="Chỉ lấy đuôi file", placeholder="vd: pdf, docx")
+                mime_types = gr.Textbox(label="Chỉ lấy MIME type (lọc ngay trên Drive)", placeholder="vd: application/pdf, video/*")
+            with gr.Row():
+                min_size_mb = gr.Number(label="Kích thước tối thiểu (MB)", value=0, minimum=0)
+                max_size_mb = gr.Number(label="Kích thước tối đa (MB, 0 là không giới hạn)", value=0, minimum=0)
+                modified_after = gr.Textbox(label="Chỉ lấy file sửa sau ngày", placeholder="YYYY-MM-DD")
+        filter_fields = [include_names, exclude_names, extensions, mime_types, min_size_mb, max_size_mb, modified_after]
+
+        output_message = gr.Textbox(label="Trạng thái Tải về", lines=3)
+
+        with gr.Accordion("Hàng đợi tải", open=True):
+            jobs_table = gr.Dataframe(headers=["Job", "Ưu tiên", "Trạng thái", "Tiến độ", "Đang tải / Kết quả"],
+                                      interactive=False, wrap=True)
+            with gr.Row():
+                job_priority = gr.Dropdown(label="Ưu tiên cho job mới", value=1,
+                                           choices=[(label, value) for value, label in JOB_PRIORITIES.items()])
+                concurrent_jobs = gr.Number(label="Số job chạy cùng lúc", value=DEFAULT_CONCURRENT_JOBS, precision=0, minimum=1)
+                job_id = gr.Number(label="Job #", precision=0)
+                pause_job_button = gr.Button("Tạm dừng")
+                resume_job_button = gr.Button("Tiếp tục")
+                cancel_job_button = gr.Button("Hủy")
+            # Kết quả đầy đủ (từng link, tệp lỗi) của job đang nhập ở ô Job #
+            job_detail = gr.Textbox(label="Chi tiết job", lines=6)
+            # Giao diện tự hỏi trạng thái job định kỳ, không phải giữ request trong lúc tải
+            jobs_timer = gr.Timer(JOB_POLL_INTERVAL)
+
+        gr.HTML("<h1><center>2. Tải file/folder lên Google Drive của bạn </center></h1>") 
+
+        destination_folder_link = gr.Textbox(label="Link thư mục Google Drive đích:", placeholder="Nhập link thư mục Google Drive đích")
+
+        with gr.Row():
+            with gr.Column(scale=5): upload_file_button = gr.Button("Tải tệp lên")
+            with gr.Column(scale=5):upload_folder_button = gr.Button("Tải thư mục lên")
+
+        sync_upload = gr.Checkbox(label="Đồng bộ khi tải thư mục lên: bỏ qua tệp giống hệt, cập nhật tệp đã thay đổi", value=False)
+
+        with gr.Row():
+            with gr.Column(scale=8): clone_source_link = gr.Textbox(label="Link thư mục chia sẻ cần sao chép thẳng vào thư mục đích (không tải về máy):", placeholder="Nhập link thư mục Google Drive nguồn")
+            with gr.Column(scale=2): clone_button = gr.Button("Sao chép vào Drive")
     
-    output_upload_message = gr.Textbox(label="Trạng thái Tải lên", lines=2)
+        output_upload_message = gr.Textbox(label="Trạng thái Tải lên", lines=2)
 
     
-    upload_file_button.click(fn=upload_files_to_drive, inputs=destination_folder_link, outputs=output_upload_message)
-    upload_folder_button.click(fn=upload_folder_to_drive, inputs=destination_folder_link, outputs=output_upload_message)
-    delete_button.click(fn=delete_api_keys, outputs=output_message, show_progress=False)
+        upload_file_button.click(fn=upload_files_to_drive, inputs=destination_folder_link, outputs=output_upload_message)
+        upload_folder_button.click(fn=upload_folder_to_drive, inputs=[destination_folder_link, workers, sync_upload, async_engine], outputs=output_upload_message)
+        clone_button.click(fn=clone_folder_to_drive, inputs=[clone_source_link, destination_folder_link, workers, async_engine] + filter_fields, outputs=output_upload_message)
+        delete_button.click(fn=delete_api_keys, outputs=output_message, show_progress=False)
     
     
     
     
     
 
-    # Browse folder when button is clicked
-    browse_button.click(fn=browse_directory, inputs=[], outputs=folder_path, show_progress=False)
+        # Browse folder when button is clicked
+        browse_button.click(fn=browse_directory, inputs=[], outputs=folder_path, show_progress=False)
     
-    # Start download
-    download_button.click(start_download_with_validation, [shared_drive_links, max_size, folder_path], output_message)
+        # Start download
+        download_button.click(start_download_with_validation, [shared_drive_links, max_size, folder_path, workers, segments, segment_threshold_mb, sync_changes, plan_order, async_engine, listing_ttl, verify_segmented, job_priority] + filter_fields, output_message)
+
+        # Bảng job và các nút điều khiển
+        jobs_timer.tick(refresh_jobs, [job_id], [jobs_table, job_detail], show_progress=False)
+        job_id.change(job_details, [job_id], job_detail, show_progress=False)
+        pause_job_button.click(lambda job: control_job('pause', job), [job_id], output_message, show_progress=False)
+        resume_job_button.click(lambda job: control_job('resume', job), [job_id], output_message, show_progress=False)
+        cancel_job_button.click(lambda job: control_job('cancel', job), [job_id], output_message, show_progress=False)
+        concurrent_jobs.change(set_concurrent_jobs, [concurrent_jobs], output_message, show_progress=False)
+
+        # Xóa cache danh sách của các link đang nhập (hoặc toàn bộ nếu ô link trống)
+        invalidate_cache_button.click(invalidate_listing_cache, [shared_drive_links], output_message, show_progress=False)
     
-    # Open output folder
-    output_folder_button.click(open_output_folder_with_validation, [folder_path], output_message, show_progress=False)
-
-demo.launch(inbrowser=True, show_error=True)
+        # Open output folder
+        output_folder_button.click(open_output_folder_with_validation, [folder_path], output_message, show_progress=False)
+
+        # Verify MD5 of downloaded files
+        verify_button.click(verify_existing_with_validation, [folder_path], output_message)
+
+    return demo
+
+
+if __name__ == "__main__":
+    # Chỉ chạy khi mở trực tiếp app.py: các tiến trình con của ProcessPoolExecutor cũng import file này
+    if len(sys.argv) > 1:
+        # Có tham số dòng lệnh: chạy không giao diện (python app.py download -i links.txt -o D:\\Tai)
+        sys.exit(run_cli(sys.argv[1:]))
+    check_json_files()
+    # Nạp credentials và service Drive trong nền: giao diện hiện ngay, không phải chờ OAuth/build()
+    threading.Thread(target=initialize_uploader, name="drive-init", daemon=True).start()
+    # Chạy tiếp các job còn dở trong nhật ký từ lần chạy trước
+    get_job_manager()
+    build_ui().launch(inbrowser=True, show_error=True)
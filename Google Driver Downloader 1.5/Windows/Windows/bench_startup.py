@@ -0,0 +1,78 @@
+"""Đo thời gian khởi động của app.py: import module, dựng giao diện và yêu cầu Drive đầu tiên.
+
+Mỗi lần đo chạy trong một tiến trình Python mới để đo đúng thời gian khởi động lạnh.
+
+    python bench_startup.py                 # chỉ đo import
+    python bench_startup.py --ui            # đo thêm thời gian dựng giao diện Gradio
+    python bench_startup.py --request       # đo thêm build() service và yêu cầu Drive đầu tiên (cần token)
+    python bench_startup.py --runs 10 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Chạy trong tiến trình con; in ra một dòng JSON {giai đoạn: số giây}
+PROBE = r'''
+import json, sys, time
+timings = {}
+start = time.perf_counter()
+import app
+timings["import"] = time.perf_counter() - start
+
+if "--ui" in sys.argv:
+    start = time.perf_counter()
+    app.build_ui()
+    timings["ui"] = time.perf_counter() - start
+
+if "--request" in sys.argv:
+    start = time.perf_counter()
+    service = app.credential_cache.service("download")
+    timings["service"] = time.perf_counter() - start
+    start = time.perf_counter()
+    app.drive_scheduler.execute(service.files().get(fileId="root", fields="id"))
+    timings["first_request"] = time.perf_counter() - start
+    start = time.perf_counter()
+    app.drive_scheduler.execute(service.files().get(fileId="root", fields="id"))
+    timings["second_request"] = time.perf_counter() - start
+
+print(json.dumps(timings))
+'''
+
+
+def run_once(flags):
+    result = subprocess.run([sys.executable, "-c", PROBE] + flags, cwd=APP_DIR,
+                            capture_output=True, text=True, check=True)
+    # Dòng cuối là kết quả, các dòng trước có thể là log của thư viện
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động của app.py")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần đo (mỗi lần một tiến trình mới)")
+    parser.add_argument("--ui", action="store_true", help="Đo thêm thời gian dựng giao diện")
+    parser.add_argument("--request", action="store_true", help="Đo thêm service và yêu cầu Drive đầu tiên")
+    parser.add_argument("--json", action="store_true", help="In kết quả từng lần đo dạng JSON lines")
+    args = parser.parse_args()
+
+    flags = [flag for flag, enabled in (("--ui", args.ui), ("--request", args.request)) if enabled]
+    runs = []
+    for _ in range(max(1, args.runs)):
+        timings = run_once(flags)
+        runs.append(timings)
+        if args.json:
+            print(json.dumps(timings))
+
+    if not args.json:
+        print(f"{'Giai đoạn':<16}{'trung vị':>10}{'nhỏ nhất':>10}{'lớn nhất':>10}  (ms, {len(runs)} lần)")
+        for stage in runs[0]:
+            values = [timings[stage] * 1000 for timings in runs]
+            print(f"{stage:<16}{statistics.median(values):>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()